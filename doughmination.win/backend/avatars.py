@@ -0,0 +1,226 @@
+import asyncio
+import multiprocessing
+import os
+import re
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import List, Optional, Tuple
+import aiofiles
+from fastapi import UploadFile
+
+try:
+    from PIL import Image, features
+except ImportError:  # Optional; avatars are served at full size without it
+    Image = None
+
+# Define data directory
+DATA_DIR = Path("dough-data")
+
+# Ensure data directory exists
+DATA_DIR.mkdir(exist_ok=True)
+
+# 2MB in bytes
+MAX_AVATAR_SIZE = 2 * 1024 * 1024
+# Uploads are copied from Starlette's spool file in chunks of this size
+CHUNK_SIZE = 64 * 1024
+
+ALLOWED_EXTENSIONS = [".jpg", ".jpeg", ".png", ".gif"]
+
+# Leading bytes of each allowed image type -> extensions it may be uploaded with
+IMAGE_SIGNATURES = [
+    (b"\x89PNG\r\n\x1a\n", (".png",)),
+    (b"\xff\xd8\xff", (".jpg", ".jpeg")),
+    (b"GIF87a", (".gif",)),
+    (b"GIF89a", (".gif",)),
+]
+SIGNATURE_SIZE = max(len(signature) for signature, _ in IMAGE_SIGNATURES)
+
+# Square bounding boxes thumbnails are made for, and the formats each is saved in
+THUMBNAIL_SIZES = (64, 128, 256)
+THUMBNAIL_FORMATS = ["png"]
+if Image is not None and features.check("webp"):
+    THUMBNAIL_FORMATS.insert(0, "webp")
+THUMBNAIL_MEDIA_TYPES = {"webp": "image/webp", "png": "image/png"}
+MAX_THUMBNAIL_WORKERS = 2
+
+# Avatars are saved as <user id>_<uuid><ext>, thumbnails as <avatar stem>_<size>.<format>
+_AVATAR_STEM = r"[A-Za-z0-9-]+_[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}"
+AVATAR_PATTERN = re.compile(
+    _AVATAR_STEM + "(?:" + "|".join(re.escape(ext) for ext in ALLOWED_EXTENSIONS) + ")"
+)
+THUMBNAIL_PATTERN = re.compile(
+    _AVATAR_STEM + "_(?:" + "|".join(map(str, THUMBNAIL_SIZES)) + r")\.(?:" + "|".join(THUMBNAIL_MEDIA_TYPES) + ")"
+)
+
+_thumbnail_pool: Optional[ProcessPoolExecutor] = None
+_thumbnail_tasks = set()
+
+
+class AvatarError(Exception):
+    """Raised when an uploaded avatar is rejected"""
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def image_extensions(header: bytes) -> Optional[tuple]:
+    """Extensions matching the image type of a file's first bytes, or None if it isn't an allowed image"""
+    for signature, extensions in IMAGE_SIGNATURES:
+        if header.startswith(signature):
+            return extensions
+    return None
+
+
+async def save_avatar(upload: UploadFile, user_id: str, file_ext: str) -> str:
+    """
+    Copy an uploaded avatar to a temporary file, checking its size and image
+    type as it goes, then move it into place. Returns the new file name.
+
+    By now Starlette has already spooled the whole request body, so the size
+    check here is only a backstop: FileSizeLimitMiddleware in main is what
+    stops oversized uploads early.
+    """
+    unique_filename = f"{user_id}_{uuid.uuid4()}{file_ext}"
+    file_path = DATA_DIR / unique_filename
+    tmp_path = DATA_DIR / f".{unique_filename}.tmp"
+
+    size = 0
+    header = b""
+    try:
+        async with aiofiles.open(tmp_path, "wb") as out_file:
+            while chunk := await upload.read(CHUNK_SIZE):
+                if len(header) < SIGNATURE_SIZE:
+                    header += chunk[:SIGNATURE_SIZE - len(header)]
+                    if len(header) >= SIGNATURE_SIZE and file_ext not in (image_extensions(header) or ()):
+                        raise AvatarError("File content does not match its image type")
+
+                size += len(chunk)
+                if size > MAX_AVATAR_SIZE:
+                    raise AvatarError("File size exceeds the limit of 2MB", status_code=413)
+                await out_file.write(chunk)
+
+        # Files shorter than any signature never got checked above
+        if file_ext not in (image_extensions(header) or ()):
+            raise AvatarError("File content does not match its image type")
+
+        os.replace(tmp_path, file_path)
+    finally:
+        if tmp_path.exists():
+            tmp_path.unlink()
+
+    return unique_filename
+
+
+def is_avatar(filename: str) -> bool:
+    """Whether filename is an uploaded avatar (not a thumbnail or any other data file)"""
+    return AVATAR_PATTERN.fullmatch(filename) is not None
+
+
+def is_avatar_or_thumbnail(filename: str) -> bool:
+    """Whether filename may be served from /avatars/"""
+    return is_avatar(filename) or THUMBNAIL_PATTERN.fullmatch(filename) is not None
+
+
+def thumbnail_filename(filename: str, size: int, fmt: str) -> str:
+    """File name of one of an avatar's thumbnails, stored next to it"""
+    return f"{os.path.splitext(filename)[0]}_{size}.{fmt}"
+
+
+def _make_thumbnails(path: str, sizes: Tuple[int, ...], formats: List[str]) -> int:
+    """Write every thumbnail of the image at path. Runs in a worker process."""
+    directory, filename = os.path.split(path)
+    written = 0
+    with Image.open(path) as img:
+        # Animated GIFs get a still of their first frame
+        img = img.convert("RGBA")
+        for size in sizes:
+            thumb = img.copy()
+            thumb.thumbnail((size, size), Image.LANCZOS)
+            for fmt in formats:
+                thumb_path = os.path.join(directory, thumbnail_filename(filename, size, fmt))
+                tmp_path = f"{thumb_path}.tmp"
+                thumb.save(tmp_path, format=fmt.upper())
+                os.replace(tmp_path, thumb_path)
+                written += 1
+    return written
+
+
+async def generate_thumbnails(filename: str):
+    """Make the thumbnails of an avatar in the process pool, off the event loop"""
+    global _thumbnail_pool
+    if Image is None:
+        return
+    if _thumbnail_pool is None:
+        # Spawned rather than forked: a fork would copy the server's threads' locks,
+        # its event loop and open connections into the workers
+        _thumbnail_pool = ProcessPoolExecutor(
+            max_workers=MAX_THUMBNAIL_WORKERS, mp_context=multiprocessing.get_context("spawn")
+        )
+
+    path = (DATA_DIR / filename).resolve()
+    try:
+        written = await asyncio.get_running_loop().run_in_executor(
+            _thumbnail_pool, _make_thumbnails, str(path), THUMBNAIL_SIZES, THUMBNAIL_FORMATS
+        )
+        print(f"Generated {written} thumbnails for {filename}")
+    except Exception as e:
+        print(f"Error generating thumbnails for {filename}: {e}")
+
+
+def schedule_thumbnails(filename: str):
+    """Generate an avatar's thumbnails in the background, once at a time per avatar"""
+    if Image is None or filename in _thumbnail_tasks or not is_avatar(filename):
+        return
+    _thumbnail_tasks.add(filename)
+    task = asyncio.create_task(generate_thumbnails(filename))
+    task.add_done_callback(lambda _: _thumbnail_tasks.discard(filename))
+
+
+def has_thumbnails(filename: str) -> bool:
+    return all(
+        (DATA_DIR / thumbnail_filename(filename, size, fmt)).is_file()
+        for size in THUMBNAIL_SIZES for fmt in THUMBNAIL_FORMATS
+    )
+
+
+def backfill_thumbnails():
+    """
+    Schedule thumbnails for avatars missing some, i.e. uploaded before
+    thumbnails existed or whose generation was cut short. Run once at startup.
+    """
+    if Image is None:
+        return
+    for path in DATA_DIR.iterdir():
+        if is_avatar(path.name) and not has_thumbnails(path.name):
+            schedule_thumbnails(path.name)
+
+
+def find_thumbnail(filename: str, size: int, accept: Optional[str]) -> Optional[Tuple[Path, str]]:
+    """
+    The thumbnail closest to size (the smallest at least that big, or the
+    largest) as (path, media type), WebP if accepted. None if it isn't made yet.
+    """
+    thumb_size = next((s for s in THUMBNAIL_SIZES if s >= size), THUMBNAIL_SIZES[-1])
+    for fmt in THUMBNAIL_FORMATS:
+        if fmt == "webp" and "image/webp" not in (accept or ""):
+            continue
+        path = DATA_DIR / thumbnail_filename(filename, thumb_size, fmt)
+        if path.is_file():
+            return path, THUMBNAIL_MEDIA_TYPES[fmt]
+    return None
+
+
+def remove_avatar(filename: str):
+    """Delete an avatar and its thumbnails"""
+    (DATA_DIR / filename).unlink(missing_ok=True)
+    for size in THUMBNAIL_SIZES:
+        for fmt in THUMBNAIL_MEDIA_TYPES:
+            (DATA_DIR / thumbnail_filename(filename, size, fmt)).unlink(missing_ok=True)
+
+
+def shutdown_thumbnail_pool():
+    global _thumbnail_pool
+    if _thumbnail_pool is not None:
+        _thumbnail_pool.shutdown(wait=False, cancel_futures=True)
+        _thumbnail_pool = None
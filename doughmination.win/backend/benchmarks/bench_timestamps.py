@@ -0,0 +1,75 @@
+"""
+Micro-benchmark for switch timestamp parsing.
+
+Compares the general parse_timestamp path with the PluralKit fast path on
+10k switches shaped like PluralKit's API output.
+
+Run from the backend directory:
+
+    python benchmarks/bench_timestamps.py
+"""
+import random
+import sys
+import timeit
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from timestamps import (  # noqa: E402
+    datetime_to_epoch_us,
+    parse_timestamp,
+    pk_timestamp_to_epoch_us,
+)
+
+SWITCH_COUNT = 10_000
+REPEATS = 5
+
+
+def make_switches(count: int = SWITCH_COUNT):
+    """Switches a few minutes to a few hours apart, newest first, like /systems/@me/switches"""
+    rng = random.Random(1234)
+    t = datetime(2025, 6, 1, tzinfo=timezone.utc)
+    switches = []
+    for i in range(count):
+        t -= timedelta(minutes=rng.randint(2, 600), microseconds=rng.randint(0, 999_999))
+        timestamp = t.strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+        # PluralKit sometimes drops trailing zeros or sends nanoseconds
+        if i % 10 == 0:
+            timestamp = t.strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3] + "Z"
+        elif i % 10 == 1:
+            timestamp = timestamp[:-1] + "123Z"
+        switches.append({
+            "id": f"{rng.getrandbits(128):032x}",
+            "timestamp": timestamp,
+            "members": [f"mem{rng.randint(0, 20):02d}"]
+        })
+    return switches
+
+
+def parse_general(switches):
+    return [datetime_to_epoch_us(parse_timestamp(switch["timestamp"])) for switch in switches]
+
+
+def parse_fast(switches):
+    return [pk_timestamp_to_epoch_us(switch["timestamp"]) for switch in switches]
+
+
+def main():
+    switches = make_switches()
+
+    expected = parse_general(switches)
+    assert parse_fast(switches) == expected, "fast path disagrees with parse_timestamp"
+
+    results = {}
+    for name, fn in (("parse_timestamp", parse_general), ("fast path", parse_fast)):
+        results[name] = min(timeit.repeat(lambda: fn(switches), number=1, repeat=REPEATS))
+
+    baseline = results["parse_timestamp"]
+    print(f"{SWITCH_COUNT} switches, best of {REPEATS}")
+    for name, seconds in results.items():
+        print(f"  {name:<16} {seconds * 1000:8.2f} ms  {baseline / seconds:6.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -14,3 +14,8 @@ def get_from_cache(key):
 def set_in_cache(key, value, ttl=30):
     expire_time = time.time() + ttl
     _cache[key] = (value, expire_time)
+
+def clear_cache(prefix="", keep=()):
+    """Remove every cached entry whose key starts with prefix, except those in keep"""
+    for key in [key for key in _cache if key.startswith(prefix) and key not in keep]:
+        del _cache[key]
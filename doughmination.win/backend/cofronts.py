@@ -0,0 +1,137 @@
+import json
+import os
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional
+
+# Define data directory
+DATA_DIR = Path("dough-data")
+DYNAMIC_COFRONTS_FILE = DATA_DIR / "dynamic_cofronts.json"
+
+# Ensure data directory exists
+DATA_DIR.mkdir(exist_ok=True)
+
+class DynamicCofrontExistsError(ValueError):
+    """Raised when a dynamic cofront for the same set of members is already registered"""
+    def __init__(self, cofront_id: str):
+        super().__init__("A dynamic cofront with these members already exists")
+        self.cofront_id = cofront_id
+
+
+# In-memory registry, loaded from disk on first use
+_registry: Optional[Dict[str, Dict]] = None  # cofront id -> definition
+_by_members: Dict[frozenset, str] = {}  # frozenset(member ids) -> cofront id
+_version = 0
+
+
+def _load():
+    global _registry, _by_members
+    if _registry is not None:
+        return
+
+    definitions = []
+    if os.path.exists(DYNAMIC_COFRONTS_FILE):
+        try:
+            with open(DYNAMIC_COFRONTS_FILE, "r") as f:
+                definitions = json.load(f)
+        except Exception as e:
+            print(f"Error loading dynamic cofronts: {e}")
+
+    _registry = {definition["id"]: definition for definition in definitions}
+    _by_members = {frozenset(d["member_ids"]): d["id"] for d in _registry.values()}
+
+
+def _save():
+    """Persist the registry and bump its version"""
+    global _version
+    _version += 1
+
+    tmp_path = DYNAMIC_COFRONTS_FILE.with_suffix(".json.tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(list(_registry.values()), f, indent=2)
+    os.replace(tmp_path, DYNAMIC_COFRONTS_FILE)
+
+
+def get_registry_version() -> int:
+    """Changes whenever a dynamic cofront is created, updated or deleted"""
+    return _version
+
+
+def get_dynamic_cofronts() -> List[Dict]:
+    """Get all dynamic cofront definitions"""
+    _load()
+    return list(_registry.values())
+
+
+def get_dynamic_cofront(cofront_id: str) -> Optional[Dict]:
+    """Get a dynamic cofront definition by ID"""
+    _load()
+    return _registry.get(cofront_id)
+
+
+def find_dynamic_cofront(member_ids: List[str]) -> Optional[Dict]:
+    """Get the dynamic cofront made up of exactly these members"""
+    _load()
+    cofront_id = _by_members.get(frozenset(member_ids))
+    return _registry.get(cofront_id) if cofront_id else None
+
+
+def create_dynamic_cofront_definition(member_ids: List[str], name: str) -> Dict:
+    """Register a dynamic cofront. Raises DynamicCofrontExistsError if these members already have one."""
+    _load()
+    if (existing := find_dynamic_cofront(member_ids)):
+        raise DynamicCofrontExistsError(existing["id"])
+
+    now = datetime.now(timezone.utc).isoformat()
+    definition = {
+        "id": str(uuid.uuid4()),
+        "name": name,
+        "member_ids": list(member_ids),
+        "created_at": now,
+        "updated_at": now
+    }
+    _registry[definition["id"]] = definition
+    _by_members[frozenset(member_ids)] = definition["id"]
+    _save()
+    return definition
+
+
+def update_dynamic_cofront_definition(
+    cofront_id: str,
+    name: Optional[str] = None,
+    member_ids: Optional[List[str]] = None
+) -> Optional[Dict]:
+    """Rename a dynamic cofront or change its members"""
+    _load()
+    definition = _registry.get(cofront_id)
+    if not definition:
+        return None
+
+    if member_ids is not None:
+        key = frozenset(member_ids)
+        other_id = _by_members.get(key)
+        if other_id and other_id != cofront_id:
+            raise DynamicCofrontExistsError(other_id)
+        _by_members.pop(frozenset(definition["member_ids"]), None)
+        _by_members[key] = cofront_id
+        definition["member_ids"] = list(member_ids)
+
+    if name:
+        definition["name"] = name
+
+    definition["updated_at"] = datetime.now(timezone.utc).isoformat()
+    _save()
+    return definition
+
+
+def delete_dynamic_cofront_definition(cofront_id: str) -> bool:
+    """Remove a dynamic cofront"""
+    _load()
+    definition = _registry.pop(cofront_id, None)
+    if not definition:
+        return False
+
+    _by_members.pop(frozenset(definition["member_ids"]), None)
+    _save()
+    return True
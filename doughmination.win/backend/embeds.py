@@ -0,0 +1,294 @@
+import asyncio
+import hashlib
+import os
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from dotenv import load_dotenv
+from pluralkit import get_members, get_members_version
+from cofronts import get_registry_version
+
+load_dotenv()
+
+STATIC_DIR = Path("static")
+INDEX_FILE = STATIC_DIR / "index.html"
+
+# "dynamic" renders embed pages on request; "prerender" writes one file per
+# member into static/members/ whenever member data changes
+EMBED_MODE = os.getenv("EMBED_MODE", "dynamic")
+PRERENDER_DIR = STATIC_DIR / "members"
+
+DEFAULT_COLOR = "#FF69B4"  # Hot pink
+FALLBACK_AVATAR = "https://www.yuri-lover.win/cdn/pfp/fallback_avatar.png"
+
+# Rendered pages kept in memory; the oldest is dropped past this many
+MAX_CACHED_PAGES = 512
+
+
+class IndexTemplate:
+    """
+    index.html split around its <head> element, so a member page is just
+    prefix + head + suffix. Reloaded only when the file's mtime changes.
+    """
+    def __init__(self, path: Path):
+        self.path = path
+        self.mtime: Optional[float] = None
+        self.prefix = ""
+        self.suffix = ""
+        self.has_head = False
+        self.version = 0
+
+    def refresh(self) -> bool:
+        """Reload the template if index.html changed. Returns False if there is no index.html."""
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except FileNotFoundError:
+            return False
+        if mtime == self.mtime:
+            return True
+
+        with open(self.path, "r", encoding="utf-8") as f:
+            html = f.read()
+
+        start = html.find("<head>")
+        end = html.find("</head>", start) if start >= 0 else -1
+        if end >= 0:
+            self.prefix, self.suffix, self.has_head = html[:start], html[end + len("</head>"):], True
+        else:
+            # Nothing to replace, serve the page as it is
+            self.prefix, self.suffix, self.has_head = html, "", False
+
+        self.mtime = mtime
+        self.version += 1
+        return True
+
+    def render(self, head: str) -> str:
+        if not self.has_head:
+            return self.prefix
+        return "".join((self.prefix, head, self.suffix))
+
+
+index_template = IndexTemplate(INDEX_FILE)
+
+# Lowercased member name -> member, and the (members, cofronts) versions it was built for
+_members_by_name: Dict[str, Dict] = {}
+_members_by_name_versions = None
+
+# Requested member name -> (fingerprint, page bytes, ETag)
+_page_cache: Dict[str, Tuple[tuple, bytes, str]] = {}
+
+
+def normalize_hex(color: Optional[str], default: str = DEFAULT_COLOR) -> str:
+    # Require a string input
+    if not isinstance(color, str) or not color:
+        return default
+    c = color.lstrip("#")
+    if len(c) == 6 and all(ch in "0123456789abcdefABCDEF" for ch in c):
+        return f"#{c.upper()}"
+    return default
+
+
+def embed_fields(member: Dict) -> tuple:
+    """The member fields a page is rendered from, escaped for attributes"""
+    color = normalize_hex(member.get("color") or DEFAULT_COLOR)
+    pronouns = member.get("pronouns") or "they/them"
+    display_name = member.get("display_name") or member.get("name")
+    description = member.get("description") or "Member of the Doughmination System®"
+    avatar_url = member.get("avatar_url") or FALLBACK_AVATAR
+
+    return (
+        color.replace('"', '&quot;'),
+        pronouns.replace('"', '&quot;'),
+        display_name.replace('"', '&quot;'),
+        description.replace('"', '&quot;'),
+        avatar_url
+    )
+
+
+def render_member_head(fields: tuple, member_name: str) -> str:
+    """The <head> element with embed meta tags for a member"""
+    color, pronouns, display_name, description, avatar_url = fields
+    return f"""
+<head>
+    <meta charset="UTF-8" />
+    <meta name="viewport" content="width=device-width, initial-scale=1.0, maximum-scale=5.0">
+
+    <title>{display_name} - {pronouns}</title>
+
+    <!-- iOS Safari Meta Tags -->
+    <meta name="apple-mobile-web-app-title" content="{display_name}" />
+    <meta name="apple-mobile-web-app-status-bar-style" content="black-translucent" />
+    <meta name="apple-mobile-web-app-capable" content="yes" />
+    <link rel="apple-touch-icon" href="{avatar_url}" />
+
+    <!-- Primary Meta Tags -->
+    <meta property="og:site_name" content="Doughmination System®" />
+    <meta property="og:title" content="{display_name} - {pronouns}" />
+    <meta property="og:description" content="{description}" />
+    <meta property="og:image" content="{avatar_url}" />
+    <meta property="og:image:width" content="400" />
+    <meta property="og:image:height" content="400" />
+    <meta property="og:type" content="profile" />
+    <meta property="og:url" content="https://www.doughmination.win/{member_name}" />
+    <meta name="theme-color" content="{color}" />
+
+    <!-- Twitter Meta Tags -->
+    <meta name="twitter:card" content="summary" />
+    <meta name="twitter:title" content="{display_name} - {pronouns}" />
+    <meta name="twitter:description" content="{description}" />
+    <meta name="twitter:image" content="{avatar_url}" />
+</head>
+"""
+
+
+async def find_member_by_name(member_name: str) -> Optional[Dict]:
+    """Look up a member (or cofront) by case-insensitive name"""
+    global _members_by_name, _members_by_name_versions
+    members = await get_members()
+
+    versions = (get_members_version(), get_registry_version())
+    if versions != _members_by_name_versions:
+        index = {}
+        for member in members:
+            # First match wins, as with a linear scan
+            index.setdefault(member.get("name", "").lower(), member)
+        _members_by_name, _members_by_name_versions = index, versions
+
+    return _members_by_name.get(member_name.lower())
+
+
+async def render_member_page(member_name: str) -> Optional[Tuple[bytes, str]]:
+    """
+    The embed page for a member as (HTML bytes, ETag), or None if there is
+    no such member or no index.html. Pages are cached per requested name and
+    only re-rendered when the member's embed fields or the template change.
+    """
+    if not index_template.refresh():
+        return None
+    member = await find_member_by_name(member_name)
+    if not member:
+        return None
+
+    fields = embed_fields(member)
+    fingerprint = (index_template.version, fields)
+    cached = _page_cache.get(member_name)
+    if cached and cached[0] == fingerprint:
+        return cached[1], cached[2]
+
+    page = index_template.render(render_member_head(fields, member_name)).encode("utf-8")
+    etag = f'"{hashlib.sha1(page).hexdigest()}"'
+
+    if member_name not in _page_cache and len(_page_cache) >= MAX_CACHED_PAGES:
+        _page_cache.pop(next(iter(_page_cache)))
+    _page_cache[member_name] = (fingerprint, page, etag)
+    return page, etag
+
+
+# Prerendered file name -> fingerprint of what was written
+_prerendered: Dict[str, tuple] = {}
+_prerender_task: Optional[asyncio.Task] = None
+_prerender_pending = False
+
+
+def prerender_filename(member_name: str) -> Optional[str]:
+    """File name for a member's prerendered page, or None if the name can't be a file"""
+    name = member_name.lower()
+    if not name or "/" in name or "\\" in name or name.startswith("."):
+        return None
+    return f"{name}.html"
+
+
+def prerendered_page_path(member_name: str) -> Optional[Path]:
+    """Path of the prerendered page for a member, if prerendering is on and it exists"""
+    if EMBED_MODE != "prerender":
+        return None
+    filename = prerender_filename(member_name)
+    if not filename:
+        return None
+    path = PRERENDER_DIR / filename
+    return path if path.is_file() else None
+
+
+def _write_pages(pages: List[Tuple[str, bytes]], keep: set) -> int:
+    """Write pages whose content differs from what is on disk, and remove pages not in keep"""
+    PRERENDER_DIR.mkdir(exist_ok=True)
+    written = 0
+    for filename, content in pages:
+        path = PRERENDER_DIR / filename
+        try:
+            if path.read_bytes() == content:
+                continue
+        except FileNotFoundError:
+            pass
+        tmp_path = path.with_suffix(".html.tmp")
+        tmp_path.write_bytes(content)
+        os.replace(tmp_path, path)
+        written += 1
+
+    for path in PRERENDER_DIR.glob("*.html"):
+        if path.name not in keep:
+            path.unlink(missing_ok=True)
+    return written
+
+
+async def prerender_member_pages():
+    """Render the embed page of every member and cofront to a file, rewriting only changed ones"""
+    if not index_template.refresh():
+        return
+    members = await get_members()
+
+    # First member with a name wins, as with the dynamic lookup
+    by_filename = {}
+    for member in members:
+        filename = prerender_filename(member.get("name", ""))
+        if filename and filename not in by_filename:
+            by_filename[filename] = member
+
+    pages = []
+    for filename, member in by_filename.items():
+        fields = embed_fields(member)
+        fingerprint = (index_template.version, fields, member["name"])
+        if _prerendered.get(filename) == fingerprint:
+            continue
+        page = index_template.render(render_member_head(fields, member["name"]))
+        pages.append((filename, page.encode("utf-8")))
+        _prerendered[filename] = fingerprint
+
+    for filename in list(_prerendered):
+        if filename not in by_filename:
+            del _prerendered[filename]
+
+    written = await asyncio.to_thread(_write_pages, pages, set(by_filename))
+    if written:
+        print(f"Prerendered {written} member pages")
+
+
+async def _run_prerender():
+    global _prerender_task, _prerender_pending
+    try:
+        # Changes that arrive mid-render get picked up by another pass
+        while True:
+            _prerender_pending = False
+            try:
+                await prerender_member_pages()
+            except Exception as e:
+                _prerendered.clear()
+                print(f"Error prerendering member pages: {e}")
+            if not _prerender_pending:
+                break
+    finally:
+        _prerender_task = None
+
+
+def schedule_prerender():
+    """Prerender member pages in the background, at most one run at a time"""
+    global _prerender_task, _prerender_pending
+    if EMBED_MODE != "prerender":
+        return
+    if _prerender_task is not None:
+        _prerender_pending = True
+        return
+    _prerender_task = asyncio.create_task(_run_prerender())
+
+
+async def on_members_changed():
+    schedule_prerender()
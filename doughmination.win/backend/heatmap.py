@@ -0,0 +1,108 @@
+from array import array
+from datetime import timedelta
+from typing import Dict, List, Optional
+from zoneinfo import ZoneInfo
+from timeline import SwitchTimeline, get_timeline
+from timestamps import EPOCH
+
+US_PER_SECOND = 1_000_000
+US_PER_HOUR = 3600 * US_PER_SECOND
+BUCKETS = 7 * 24  # weekday * 24 + hour, Monday first
+
+# Heatmaps are kept per timezone; drop the oldest past this many
+MAX_TIMEZONES = 32
+
+
+class FrontingHeatmap:
+    """
+    Per-member fronting time by local day of week and hour of day for one
+    timezone, as fixed arrays of 168 microsecond totals.
+
+    Like the rollups, only closed switch intervals are accumulated, updated
+    incrementally as switches are appended; the open interval after the
+    latest switch is added when the heatmap is read.
+    """
+    def __init__(self, tz: ZoneInfo):
+        self.tz = tz
+        self.buckets: Dict[str, array] = {}  # member id -> array('q') of BUCKETS
+        self.timeline: Optional[SwitchTimeline] = None
+        self.count = 0
+
+    def update(self, timeline: SwitchTimeline):
+        """Add intervals closed since the last update, or rebuild if history changed"""
+        if timeline is self.timeline:
+            return
+
+        start = self.count - 1
+        appended = (
+            self.timeline is not None
+            and self.count > 0
+            and timeline.rewrites == self.timeline.rewrites
+            and len(timeline) >= self.count
+            and timeline.switch_ids[start] == self.timeline.switch_ids[start]
+        )
+        if not appended:
+            self.buckets = {}
+            start = 0
+
+        timestamps = timeline.timestamps
+        for i in range(max(start, 0), len(timeline) - 1):
+            self._add(self.buckets, timestamps[i], timestamps[i + 1], timeline.member_id_list(i))
+
+        self.timeline = timeline
+        self.count = len(timeline)
+
+    def _add(self, buckets: Dict[str, array], start: int, end: int, member_ids: List[str]):
+        """Split [start, end) at local hour boundaries and add each piece to its bucket"""
+        if not member_ids:
+            return
+        member_buckets = [buckets.setdefault(m, array("q", bytes(8 * BUCKETS))) for m in member_ids]
+
+        while start < end:
+            local = (EPOCH + timedelta(microseconds=start)).astimezone(self.tz)
+            into_hour = (local.minute * 60 + local.second) * US_PER_SECOND + local.microsecond
+            piece_end = min(start + US_PER_HOUR - into_hour, end)
+            bucket = local.weekday() * 24 + local.hour
+            for totals in member_buckets:
+                totals[bucket] += piece_end - start
+            start = piece_end
+
+    def seconds(self, now_us: int) -> Dict[str, List[List[float]]]:
+        """Fronting seconds per member as 7 rows (Monday first) of 24 hours, up to now"""
+        buckets = dict(self.buckets)
+        timeline = self.timeline
+        if timeline is not None and len(timeline):
+            # Copy only the arrays the open interval adds to
+            open_ids = timeline.member_id_list(len(timeline) - 1)
+            for member_id in open_ids:
+                if member_id in buckets:
+                    buckets[member_id] = array("q", buckets[member_id])
+            self._add(buckets, timeline.timestamps[-1], now_us, open_ids)
+
+        return {
+            member_id: [[us / US_PER_SECOND for us in totals[day * 24:(day + 1) * 24]] for day in range(7)]
+            for member_id, totals in buckets.items()
+        }
+
+
+_heatmaps: Dict[str, FrontingHeatmap] = {}
+
+
+async def get_heatmap(tz_name: str) -> FrontingHeatmap:
+    """
+    Get the heatmap for a timezone, brought up to date with the switch
+    timeline. Raises ValueError for unknown timezones.
+    """
+    heatmap = _heatmaps.get(tz_name)
+    if heatmap is None:
+        try:
+            tz = ZoneInfo(tz_name)
+        except (KeyError, ValueError):
+            raise ValueError(f"Unknown timezone: {tz_name}")
+
+        if len(_heatmaps) >= MAX_TIMEZONES:
+            _heatmaps.pop(next(iter(_heatmaps)))
+        heatmap = _heatmaps[tz_name] = FrontingHeatmap(tz)
+
+    heatmap.update(await get_timeline())
+    return heatmap
@@ -0,0 +1,154 @@
+import csv
+import io
+import json
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, List, Optional
+from pluralkit import build_fronters_payload, get_member_index, get_cofront_index
+from switch_store import get_switch_page, get_switch_position, iter_switches
+from timeline import get_timeline
+from timestamps import datetime_to_epoch_us, epoch_us_to_datetime, parse_timestamp
+
+# Cap on fronting periods returned by a single range query
+MAX_PERIODS = 5000
+
+# Page size limit for the switch history listing
+MAX_PAGE_SIZE = 500
+
+EXPORT_CSV_COLUMNS = ["id", "timestamp", "member_ids", "member_names"]
+
+
+def member_ref(member_id: str, member_index: Dict[str, Dict]) -> Dict[str, Any]:
+    """Short member reference for history listings, resolved through the member index"""
+    member = member_index.get(member_id, {})
+    name = member.get("name", member_id)
+    return {
+        "id": member_id,
+        "name": name,
+        "display_name": member.get("display_name") or name
+    }
+
+
+async def get_fronters_at(ts_us: int) -> Dict[str, Any]:
+    """
+    Who was fronting at ts_us (epoch microseconds), from the local switch
+    timeline. Shaped like /api/fronters, plus the queried "at" time.
+    """
+    timeline = await get_timeline(sync=False)
+    at = epoch_us_to_datetime(ts_us).isoformat()
+
+    # The switch in effect is the last one at or before ts
+    i = timeline.index_after(ts_us) - 1
+    if i < 0:
+        return {"at": at, "id": None, "timestamp": None, "members": []}
+
+    switch = {
+        "id": timeline.switch_ids[i],
+        "timestamp": epoch_us_to_datetime(timeline.timestamps[i]).isoformat(),
+        "members": timeline.member_id_list(i)
+    }
+    payload = build_fronters_payload(switch, await get_member_index(), await get_cofront_index())
+    return {"at": at, **payload}
+
+
+async def get_fronters_between(start_us: int, end_us: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Fronting periods overlapping [start_us, end_us), clipped to the range.
+    end_us defaults to now, and the latest period has no end if it is still ongoing.
+    """
+    timeline = await get_timeline(sync=False)
+    timestamps = timeline.timestamps
+    count = len(timeline)
+    member_index = await get_member_index()
+    cofront_index = await get_cofront_index()
+    now_us = datetime_to_epoch_us(datetime.now(timezone.utc))
+    if end_us is None:
+        end_us = now_us
+
+    periods: List[Dict[str, Any]] = []
+    i = max(timeline.index_after(start_us) - 1, 0)
+    while i < count and timestamps[i] < end_us and len(periods) < MAX_PERIODS:
+        if i + 1 < count:
+            period_end = min(timestamps[i + 1], end_us)
+        else:
+            period_end = end_us if end_us < now_us else None  # Still fronting
+        member_ids = timeline.member_id_list(i)
+        cofront = cofront_index.get(frozenset(member_ids)) if len(member_ids) > 1 else None
+
+        periods.append({
+            "switch_id": timeline.switch_ids[i],
+            "start": epoch_us_to_datetime(max(timestamps[i], start_us)).isoformat(),
+            "end": epoch_us_to_datetime(period_end).isoformat() if period_end is not None else None,
+            "members": [member_ref(member_id, member_index) for member_id in member_ids],
+            "cofront": cofront.get("name") if cofront else None
+        })
+        i += 1
+
+    return {
+        "start": epoch_us_to_datetime(start_us).isoformat(),
+        "end": epoch_us_to_datetime(end_us).isoformat(),
+        "periods": periods,
+        "truncated": i < count and timestamps[i] < end_us
+    }
+
+
+def _resolve_cursor(cursor: str):
+    """A cursor is a switch ID, or a timestamp to list switches from (exclusive)"""
+    position = get_switch_position(cursor)
+    if position is not None:
+        return position
+    try:
+        # Every ID sorts after "", so switches at exactly this time are excluded
+        return (datetime_to_epoch_us(parse_timestamp(cursor)), "")
+    except ValueError:
+        raise ValueError(f"Unknown cursor: {cursor}")
+
+
+async def get_switch_history(before: Optional[str] = None, limit: int = 50) -> Dict[str, Any]:
+    """
+    One page of the switch history, newest first. Pass the returned
+    next_cursor as `before` to get the following page.
+    """
+    position = _resolve_cursor(before) if before else None
+    limit = min(max(limit, 1), MAX_PAGE_SIZE)
+
+    switches = get_switch_page(position, limit)
+    member_index = await get_member_index()
+    for switch in switches:
+        switch["members"] = [member_ref(member_id, member_index) for member_id in switch["members"]]
+
+    return {
+        "switches": switches,
+        "next_cursor": switches[-1]["id"] if len(switches) == limit else None
+    }
+
+
+def _member_names(member_ids: List[str], member_index: Dict[str, Dict]) -> List[str]:
+    return [member_index.get(member_id, {}).get("name", member_id) for member_id in member_ids]
+
+
+def export_switches_ndjson(member_index: Dict[str, Dict]) -> Iterator[str]:
+    """Stream the full switch history oldest first as newline-delimited JSON"""
+    for switch in iter_switches():
+        switch["member_names"] = _member_names(switch["members"], member_index)
+        yield json.dumps(switch) + "\n"
+
+
+def export_switches_csv(member_index: Dict[str, Dict]) -> Iterator[str]:
+    """Stream the full switch history oldest first as CSV, members joined with ';'"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def row(values) -> str:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerow(values)
+        return buffer.getvalue()
+
+    yield row(EXPORT_CSV_COLUMNS)
+    for switch in iter_switches():
+        yield row([
+            switch["id"],
+            switch["timestamp"],
+            ";".join(switch["members"]),
+            ";".join(_member_names(switch["members"], member_index))
+        ])
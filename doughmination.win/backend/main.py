@@ -3,27 +3,37 @@
 # ============================================================================
 import os
 import shutil
-import aiofiles
-import uuid
 import json
 import asyncio
-import re
 import weakref
+import math
+from contextlib import asynccontextmanager
 from datetime import datetime, timezone
 from pathlib import Path
 from typing import List, Optional, Set, Dict, Any
 
 from fastapi import FastAPI, HTTPException, Request, Depends, Security, status, File, UploadFile, WebSocket, WebSocketDisconnect, Body
-from fastapi.responses import JSONResponse, FileResponse, RedirectResponse, Response, HTMLResponse
+from fastapi.responses import JSONResponse, FileResponse, RedirectResponse, Response, HTMLResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from starlette.middleware.base import BaseHTTPMiddleware
 from fastapi.security import SecurityScopes
 from jose import JWTError
 from dotenv import load_dotenv
 
 # Local imports
-from pluralkit import get_system, get_members, get_fronters, set_front, create_dynamic_cofront, MAX_FRONTERS
+from pluralkit import (
+    get_member_index, get_system, get_members, get_fronters, create_dynamic_cofront, MAX_FRONTERS,
+    reconcile_fronters, invalidate_members, update_dynamic_cofront, delete_dynamic_cofront,
+    add_members_listener, with_stale_flag
+)
+from cofronts import get_dynamic_cofronts, get_dynamic_cofront, DynamicCofrontExistsError
+from switch_queue import SwitchQueue
+from pluralkit_client import pk_client, PluralKitRateLimitError, PluralKitUnavailableError
+from snapshots import stale_since
+from switch_store import (
+    run_sync_loop as run_switch_sync_loop, get_stats as get_switch_store_stats,
+    ensure_recent as ensure_switch_history_recent
+)
 from auth import router as auth_router, get_current_user, oauth2_scheme
 from subsystems import (
     get_subsystems, get_member_tags, get_members_by_subsystem, 
@@ -32,18 +42,51 @@ from subsystems import (
 )
 from models import (
     UserCreate, UserResponse, UserUpdate, MentalState, DynamicCofrontCreate, 
-    CofrontResponse, MultiSwitchRequest, MultiSwitchResponse, SubSystem, 
+    DynamicCofrontUpdate, CofrontResponse, MultiSwitchRequest, MultiSwitchResponse, SubSystem, 
     MemberTag, SubSystemFilter
 )
 from users import get_users, create_user, delete_user, initialize_admin_user, update_user, get_user_by_id
-from metrics import get_fronting_time_metrics, get_switch_frequency_metrics
+from metrics import get_fronting_time_metrics, get_switch_frequency_metrics, get_cofronting_metrics, get_heatmap_metrics
+from timestamps import parse_timestamp, datetime_to_epoch_us
+from views import get_view, view_response
+from avatars import (
+    MAX_AVATAR_SIZE, ALLOWED_EXTENSIONS, AvatarError, save_avatar, schedule_thumbnails,
+    find_thumbnail, remove_avatar, shutdown_thumbnail_pool, is_avatar_or_thumbnail, backfill_thumbnails
+)
+from mental_state import (
+    get_current_mental_state, get_mental_state_version, set_mental_state, get_mental_state_history
+)
+from normalized import FORMATS, normalize_fronters, parse_fields, paginate, members_payload
+from embeds import (
+    EMBED_MODE, render_member_page, prerendered_page_path, schedule_prerender, on_members_changed
+)
+from history import (
+    get_fronters_at, get_fronters_between, get_switch_history,
+    export_switches_ndjson, export_switches_csv
+)
 
 # ============================================================================
 # APPLICATION SETUP
 # ============================================================================
 load_dotenv()
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Keep the local switch history in sync for metrics
+    sync_task = asyncio.create_task(run_switch_sync_loop())
+    # Write member embed pages up front and again whenever members change
+    if EMBED_MODE == "prerender":
+        add_members_listener(on_members_changed)
+        schedule_prerender()
+    # Thumbnails are made on upload; catch up on avatars that don't have them yet
+    backfill_thumbnails()
+    yield
+    sync_task.cancel()
+    # Close the shared PluralKit connection pool
+    await pk_client.aclose()
+    shutdown_thumbnail_pool()
+
+app = FastAPI(lifespan=lifespan)
 
 # Initialize the admin user if no users exist
 initialize_admin_user()
@@ -59,23 +102,69 @@ DEFAULT_AVATAR = "https://www.yuri-lover.win/cdn/pfp/fallback_avatar.png"
 # ============================================================================
 
 # File size limit middleware
-class FileSizeLimitMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
-        if request.method == 'POST' and '/avatar' in request.url.path:
-            try:
-                # 2MB in bytes
-                MAX_SIZE = 2 * 1024 * 1024
-                content_length = request.headers.get('content-length')
-                if content_length and int(content_length) > MAX_SIZE:
-                    return JSONResponse(
-                        status_code=413,
-                        content={"detail": "File size exceeds the limit of 2MB"}
-                    )
-            except:
-                pass
+class FileSizeLimitMiddleware:
+    """
+    Rejects avatar uploads over MAX_AVATAR_SIZE with a 413. This is the
+    only place the limit cuts an upload short: Starlette spools the whole
+    multipart body before the endpoint runs, so the body is counted here as
+    it arrives and uploads without (or lying about) a content-length are
+    stopped as soon as they go over, before the rest is read.
+    """
+    def __init__(self, app, max_size: int = MAX_AVATAR_SIZE):
+        self.app = app
+        self.max_size = max_size
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or "/avatar" not in scope["path"]:
+            return await self.app(scope, receive, send)
+        
+        too_large = JSONResponse(
+            status_code=413,
+            content={"detail": "File size exceeds the limit of 2MB"}
+        )
+        
+        content_length = dict(scope["headers"]).get(b"content-length")
+        try:
+            if content_length and int(content_length) > self.max_size:
+                return await too_large(scope, receive, send)
+        except ValueError:
+            pass
         
-        response = await call_next(request)
-        return response
+        received = 0
+        exceeded = False
+        response_started = False
+        
+        async def limited_receive():
+            nonlocal received, exceeded
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_size:
+                    exceeded = True
+                    # Aborts the multipart parser mid-body. FastAPI passes an HTTPException
+                    # raised while parsing the form through as is, and checked_send swaps
+                    # any other response the app makes of it for the 413.
+                    raise HTTPException(status_code=413, detail="File size exceeds the limit of 2MB")
+            return message
+        
+        async def checked_send(message):
+            nonlocal response_started
+            if exceeded:
+                # Whatever the app made of the cut-off body, answer with a 413
+                if message["type"] == "http.response.start" and not response_started:
+                    response_started = True
+                    await too_large(scope, receive, send)
+                return
+            response_started = True
+            await send(message)
+        
+        try:
+            await self.app(scope, limited_receive, checked_send)
+        except HTTPException:
+            if not exceeded:
+                raise
+            if not response_started:
+                await too_large(scope, receive, send)
 
 # CORS
 app.add_middleware(
@@ -105,6 +194,32 @@ app.include_router(auth_router)
 FRONTEND_BUILD_DIR = Path("static")  # Files are copied here by Docker
 STATIC_DIR = Path("static")
 
+# PluralKit errors that should reach clients as a retryable 503
+PLURALKIT_RETRY_ERRORS = (PluralKitRateLimitError, PluralKitUnavailableError)
+
+def pluralkit_retry_exception(e) -> HTTPException:
+    return HTTPException(
+        status_code=503,
+        detail=str(e),
+        headers={"Retry-After": str(math.ceil(e.retry_after))}
+    )
+
+# Serve hot endpoints from pre-serialized views
+def cached_view(key: str, sources: tuple, build, *snapshot_keys: str, headers: Optional[Dict[str, str]] = None):
+    """
+    The cached view of build()'s payload, rebuilt only when sources changed.
+    Flags stale PluralKit data with X-Data-Stale.
+    """
+    headers = dict(headers or {})
+    saved_at = stale_since(*snapshot_keys) if snapshot_keys else None
+    if saved_at:
+        headers["X-Data-Stale"] = saved_at
+    return get_view(key, sources, build, headers)
+
+def cached_response(request: Request, key: str, sources: tuple, build, *snapshot_keys: str, headers: Optional[Dict[str, str]] = None):
+    """Serve a cached view of build()'s payload with ETag handling"""
+    return view_response(request, cached_view(key, sources, build, *snapshot_keys, headers=headers))
+
 # Optional authentication function for public endpoints
 async def get_optional_user(token: str = Security(oauth2_scheme, scopes=[])):
     try:
@@ -119,7 +234,6 @@ async def get_optional_user(token: str = Security(oauth2_scheme, scopes=[])):
 
 DATA_DIR = Path("dough-data")
 DATA_DIR.mkdir(exist_ok=True)
-MENTAL_STATE_FILE = DATA_DIR / "mental_state.json"
 
 # Check if we have a built frontend to serve
 if FRONTEND_BUILD_DIR.exists() and (FRONTEND_BUILD_DIR / "index.html").exists():
@@ -273,6 +387,14 @@ async def websocket_endpoint(websocket: WebSocket):
     await manager.connect(websocket)
     
     try:
+        # Let late joiners know we are serving cached data
+        if pk_client.breaker.state != pk_client.breaker.CLOSED:
+            await websocket.send_text(json.dumps({
+                "type": "degraded",
+                "timestamp": datetime.now(timezone.utc).isoformat(),
+                "data": degraded_status()
+            }))
+        
         while True:
             # Keep the connection alive
             data = await websocket.receive_text()
@@ -318,35 +440,100 @@ async def broadcast_cofront_update(cofront_data: dict):
     """Broadcast when a new dynamic cofront is created or updated"""
     await broadcast_frontend_update("cofront_update", cofront_data)
 
+def degraded_status() -> dict:
+    """Current PluralKit availability as reported to clients"""
+    breaker = pk_client.breaker
+    since = breaker.degraded_since
+    return {
+        "degraded": breaker.state != breaker.CLOSED,
+        "state": breaker.state,
+        "since": datetime.fromtimestamp(since, timezone.utc).isoformat() if since else None
+    }
+
+async def broadcast_degraded_update(state: str):
+    """Broadcast when PluralKit becomes unavailable or recovers"""
+    await broadcast_frontend_update("degraded", degraded_status())
+
+# Tell clients when the PluralKit circuit breaker opens or closes
+pk_client.breaker.add_listener(broadcast_degraded_update)
+
+# ============================================================================
+# FRONT SWITCHING HELPERS
+# ============================================================================
+
+# Seconds to wait after a switch before confirming fronters with PluralKit
+RECONCILE_DELAY = 5
+
+_reconcile_task: Optional[asyncio.Task] = None
+
+async def _reconcile_fronters_later():
+    """Confirm the optimistic fronters and broadcast again if PluralKit disagrees"""
+    try:
+        await asyncio.sleep(RECONCILE_DELAY)
+        fronters_data = await reconcile_fronters()
+        if fronters_data is not None:
+            print("Fronters changed after reconciliation, broadcasting update")
+            await broadcast_fronting_update(fronters_data)
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        print(f"Error reconciling fronters: {e}")
+
+async def _after_switch(fronters_data: dict):
+    """Broadcast the optimistic fronters and schedule a check against PluralKit"""
+    global _reconcile_task
+    
+    await broadcast_fronting_update(fronters_data)
+    
+    # Only the latest switch needs confirming
+    if _reconcile_task is not None and not _reconcile_task.done():
+        _reconcile_task.cancel()
+    _reconcile_task = asyncio.create_task(_reconcile_fronters_later())
+
+# Collapses rapid switches and skips ones that would change nothing
+switch_queue = SwitchQueue(on_applied=_after_switch)
+
+async def switch_and_broadcast(member_ids: List[str]) -> dict:
+    """
+    Switch front with a single upstream write, then update the cached
+    fronters locally and broadcast them straight away.
+    Returns the final result of the switch batch this request joined.
+    """
+    return await switch_queue.submit(member_ids)
+
 # ============================================================================
 # MENTAL STATE API ENDPOINTS
 # ============================================================================
 
+def mental_state_view():
+    return cached_view("mental-state", (get_mental_state_version(),), get_current_mental_state)
+
 @app.get("/api/mental-state")
-async def get_mental_state():
-    """Get current mental state from database"""
+async def get_mental_state(request: Request):
+    """Get current mental state"""
+    return view_response(request, mental_state_view())
+
+@app.get("/api/mental-state/history")
+async def mental_state_history(
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    limit: int = 1000,
+    user = Depends(get_current_user)
+):
+    """Get mental state changes between start and end, oldest first"""
     try:
-        # Check if mental_state.json exists
-        if os.path.exists(MENTAL_STATE_FILE):
-            with open(MENTAL_STATE_FILE, "r") as f:
-                state_data = json.load(f)
-                # Convert the string back to datetime
-                state_data["updated_at"] = datetime.fromisoformat(state_data["updated_at"])
-                return MentalState(**state_data)
-        else:
-            # Default state
-            return MentalState(
-                level="safe",
-                updated_at=datetime.now(timezone.utc),
-                notes=None
-            )
-    except Exception as e:
-        print(f"Error loading mental state: {e}")
-        return MentalState(
-            level="safe",
-            updated_at=datetime.now(timezone.utc),
-            notes=None
-        )
+        start_dt = parse_timestamp(start) if start else None
+        end_dt = parse_timestamp(end) if end else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="start and end must be ISO 8601 timestamps")
+    if start_dt and end_dt and end_dt <= start_dt:
+        raise HTTPException(status_code=400, detail="end must be after start")
+    
+    return get_mental_state_history(
+        datetime_to_epoch_us(start_dt) if start_dt else None,
+        datetime_to_epoch_us(end_dt) if end_dt else None,
+        limit
+    )
 
 @app.post("/api/mental-state")
 async def update_mental_state(state: MentalState, user = Depends(get_current_user)):
@@ -355,11 +542,7 @@ async def update_mental_state(state: MentalState, user = Depends(get_current_use
         raise HTTPException(status_code=403, detail="Admin privileges required")
     
     try:
-        state_data = state.dict()
-        state_data["updated_at"] = state_data["updated_at"].isoformat()
-        
-        with open(MENTAL_STATE_FILE, "w") as f:
-            json.dump(state_data, f, indent=2)
+        state_data = set_mental_state(state)
         
         # Broadcast the mental state update
         await broadcast_mental_state_update(state_data)
@@ -372,40 +555,62 @@ async def update_mental_state(state: MentalState, user = Depends(get_current_use
 # SYSTEM AND MEMBER API ENDPOINTS
 # ============================================================================
 
+def system_view(system_data: dict):
+    # Add mental state to system data
+    def build():
+        return {**system_data, "mental_state": get_current_mental_state().dict()}
+    
+    return cached_view("system", (system_data, get_mental_state_version()), build, "system")
+
 @app.get("/api/system")
-async def system_info():
+async def system_info(request: Request):
     try:
         # Get system data
         system_data = await get_system()
-        
-        # Get mental state
-        mental_state_data = None
-        if os.path.exists(MENTAL_STATE_FILE):
-            with open(MENTAL_STATE_FILE, "r") as f:
-                state_data = json.load(f)
-                # Convert the string back to datetime for the response
-                state_data["updated_at"] = datetime.fromisoformat(state_data["updated_at"])
-                mental_state_data = MentalState(**state_data)
-        else:
-            mental_state_data = MentalState(
-                level="safe",
-                updated_at=datetime.now(timezone.utc),
-                notes=None
-            )
-        
-        # Add mental state to system data
-        system_data["mental_state"] = mental_state_data.dict()
-        
-        return system_data
+        return view_response(request, system_view(system_data))
+    except PLURALKIT_RETRY_ERRORS as e:
+        raise pluralkit_retry_exception(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to fetch system info: {str(e)}")
 
+def members_view(
+    members: List[Dict],
+    subsystem: Optional[str] = None,
+    include_untagged: bool = True,
+    format: str = "full",
+    field_list: Optional[tuple] = None,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = None
+):
+    """The /api/members view. Raises ValueError for unknown cursors."""
+    page, next_cursor = paginate(members, cursor, limit)
+    return cached_view(
+        f"members:{subsystem}:{include_untagged}:{format}:{field_list}:{cursor}:{limit}", (members,),
+        lambda: members_payload(page, format, field_list), "members_raw",
+        headers={"X-Next-Cursor": next_cursor} if next_cursor else None
+    )
+
 @app.get("/api/members")
 async def members(
+    request: Request,
     subsystem: Optional[str] = None,
-    include_untagged: bool = True
+    include_untagged: bool = True,
+    format: str = "full",
+    fields: Optional[str] = None,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None
 ):
-    """Get members, optionally filtered by sub-system"""
+    """
+    Get members, optionally filtered by sub-system. format=normalized keys
+    members by ID without duplicates, fields= picks member fields, and
+    limit/cursor paginate (the next cursor is in the X-Next-Cursor header).
+    """
+    if format not in FORMATS:
+        raise HTTPException(status_code=400, detail=f"Invalid format. Valid options: {', '.join(FORMATS)}")
+    if limit is not None and limit < 1:
+        raise HTTPException(status_code=400, detail="limit must be at least 1")
+    field_list = parse_fields(fields)
+    
     try:
         if subsystem:
             # Validate subsystem parameter
@@ -417,19 +622,74 @@ async def members(
                     detail=f"Invalid subsystem. Valid options: {', '.join(valid_labels)}"
                 )
         
-        return await get_members(subsystem, include_untagged)
+        members = await get_members(subsystem, include_untagged)
+        try:
+            view = members_view(members, subsystem, include_untagged, format, field_list, cursor, limit)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        
+        return view_response(request, view)
     except HTTPException as http_exc:
         raise http_exc
+    except PLURALKIT_RETRY_ERRORS as e:
+        raise pluralkit_retry_exception(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to fetch members: {str(e)}")
 
+def fronters_view(fronters_data: dict, format: str = "full"):
+    build = (lambda: normalize_fronters(fronters_data)) if format == "normalized" else (lambda: fronters_data)
+    return cached_view(f"fronters:{format}", (fronters_data,), build, "fronters_raw", "members_raw")
+
 @app.get("/api/fronters")
-async def fronters():
+async def fronters(request: Request, format: str = "full"):
+    if format not in FORMATS:
+        raise HTTPException(status_code=400, detail=f"Invalid format. Valid options: {', '.join(FORMATS)}")
+    
+    try:
+        fronters_data = await get_fronters()
+        return view_response(request, fronters_view(fronters_data, format))
+    except PLURALKIT_RETRY_ERRORS as e:
+        raise pluralkit_retry_exception(e)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to fetch fronters: {str(e)}")
+
+@app.get("/api/fronters/at")
+async def fronters_at(ts: str, user = Depends(get_current_user)):
+    """Get who was fronting at a given time, from the local switch history"""
+    try:
+        ts_dt = parse_timestamp(ts)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="ts must be an ISO 8601 timestamp")
+
     try:
-        return await get_fronters()
+        return with_stale_flag(await get_fronters_at(datetime_to_epoch_us(ts_dt)), "switches")
+    except PLURALKIT_RETRY_ERRORS as e:
+        raise pluralkit_retry_exception(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to fetch fronters: {str(e)}")
 
+@app.get("/api/fronters/between")
+async def fronters_between(start: str, end: Optional[str] = None, user = Depends(get_current_user)):
+    """Get the fronting periods between two times, from the local switch history"""
+    try:
+        start_dt = parse_timestamp(start)
+        end_dt = parse_timestamp(end) if end else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="start and end must be ISO 8601 timestamps")
+    if end_dt and end_dt <= start_dt:
+        raise HTTPException(status_code=400, detail="end must be after start")
+
+    try:
+        periods = await get_fronters_between(
+            datetime_to_epoch_us(start_dt),
+            datetime_to_epoch_us(end_dt) if end_dt else None
+        )
+        return with_stale_flag(periods, "switches")
+    except PLURALKIT_RETRY_ERRORS as e:
+        raise pluralkit_retry_exception(e)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to fetch fronting history: {str(e)}")
+
 @app.get("/api/member/{member_id}")
 async def member_detail(member_id: str):
     try:
@@ -438,9 +698,46 @@ async def member_detail(member_id: str):
             if member["id"] == member_id or member["name"].lower() == member_id.lower():
                 return member
         raise HTTPException(status_code=404, detail="Member not found")
+    except PLURALKIT_RETRY_ERRORS as e:
+        raise pluralkit_retry_exception(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to fetch member details: {str(e)}")
 
+@app.get("/api/switches")
+async def switch_history(before: Optional[str] = None, limit: int = 50, user = Depends(get_current_user)):
+    """Get the switch history newest first, paginated with the next_cursor of the previous page"""
+    try:
+        return with_stale_flag(await get_switch_history(before, limit), "switches")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except PLURALKIT_RETRY_ERRORS as e:
+        raise pluralkit_retry_exception(e)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to fetch switch history: {str(e)}")
+
+@app.get("/api/switches/export")
+async def export_switch_history(format: str = "ndjson", user = Depends(get_current_user)):
+    """Stream the full switch history as NDJSON or CSV"""
+    if format not in ("ndjson", "csv"):
+        raise HTTPException(status_code=400, detail="format must be ndjson or csv")
+
+    try:
+        await ensure_switch_history_recent(0)
+        member_index = await get_member_index()
+    except PLURALKIT_RETRY_ERRORS as e:
+        raise pluralkit_retry_exception(e)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to export switch history: {str(e)}")
+
+    if format == "csv":
+        content, media_type = export_switches_csv(member_index), "text/csv"
+    else:
+        content, media_type = export_switches_ndjson(member_index), "application/x-ndjson"
+    headers = {"Content-Disposition": f'attachment; filename="switches.{format}"'}
+    if (saved_at := stale_since("switches")):
+        headers["X-Data-Stale"] = saved_at
+    return StreamingResponse(content, media_type=media_type, headers=headers)
+
 # ============================================================================
 # FRONTING CONTROL API ENDPOINTS
 # ============================================================================
@@ -461,13 +758,16 @@ async def switch_front(request: Request, user = Depends(get_current_user)):
                 detail=f"Cannot have more than {MAX_FRONTERS} members fronting at once"
             )
 
-        await set_front(member_ids)
-        
-        # Broadcast the fronting update
-        fronters_data = await get_fronters()
-        await broadcast_fronting_update(fronters_data)
+        # Switch and broadcast the fronting update
+        result = await switch_and_broadcast(member_ids)
         
-        return {"status": "success", "message": "Front updated successfully"}
+        return {
+            "status": "success",
+            "message": "Front updated successfully",
+            "fronters": result["fronters"]
+        }
+    except PLURALKIT_RETRY_ERRORS as e:
+        raise pluralkit_retry_exception(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -480,19 +780,22 @@ async def switch_single_front(request: Request, user = Depends(get_current_user)
         if not member_id:
             raise HTTPException(status_code=400, detail="member_id is required")
 
-        result = await set_front([member_id])
+        # Switch and broadcast the update, even if PluralKit returned no body
+        result = await switch_and_broadcast([member_id])
 
-        # After successful switch, broadcast the update
-        if result or True:  # Broadcast even if result is None
-            # Fetch the updated fronters data
-            fronters_data = await get_fronters()
-            await broadcast_fronting_update(fronters_data)
-
-        return {"success": True, "message": "Front updated", "data": result}
+        return {
+            "success": True,
+            "message": "Front updated",
+            "data": result["switch"],
+            "fronters": result["fronters"]
+        }
 
     except HTTPException as http_exc:
         raise http_exc
 
+    except PLURALKIT_RETRY_ERRORS as e:
+        raise pluralkit_retry_exception(e)
+
     except Exception as e:
         print("Error in /api/switch_front:", e)
         raise HTTPException(status_code=500, detail=f"Failed to switch front: {str(e)}")
@@ -519,26 +822,18 @@ async def switch_multiple_fronters(
                 detail=f"Cannot have more than {MAX_FRONTERS} members fronting at once"
             )
         
-        # Get the members to show their names in the response
-        all_members = await get_members()
-        switching_members = []
-        
-        for member_id in member_ids:
-            for member in all_members:
-                if member.get("id") == member_id:
-                    switching_members.append({
-                        "id": member.get("id"),
-                        "name": member.get("name"),
-                        "display_name": member.get("display_name", member.get("name"))
-                    })
-                    break
-        
-        # Switch the fronters
-        await set_front(member_ids)
+        # Switch the fronters and broadcast the fronting update
+        result = await switch_and_broadcast(member_ids)
         
-        # Broadcast the fronting update
-        fronters_data = await get_fronters()
-        await broadcast_fronting_update(fronters_data)
+        # Report the final fronters, which may come from a later request in the same batch
+        switching_members = [
+            {
+                "id": member.get("id"),
+                "name": member.get("name"),
+                "display_name": member.get("display_name", member.get("name"))
+            }
+            for member in result["fronters"].get("members", [])
+        ]
         
         # Return detailed information about the switch
         return {
@@ -547,6 +842,8 @@ async def switch_multiple_fronters(
             "fronters": switching_members,
             "count": len(switching_members)
         }
+    except PLURALKIT_RETRY_ERRORS as e:
+        raise pluralkit_retry_exception(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -579,11 +876,7 @@ async def create_custom_cofront(
         # Set this cofront as the current fronter
         if data.get("set_as_current", False):
             # We'll use the member IDs directly here
-            await set_front(member_ids)
-            
-            # Broadcast the fronting update
-            fronters_data = await get_fronters()
-            await broadcast_fronting_update(fronters_data)
+            await switch_and_broadcast(member_ids)
         
         # Broadcast the cofront creation/update
         await broadcast_cofront_update({
@@ -596,14 +889,18 @@ async def create_custom_cofront(
             "message": "Dynamic cofront created successfully",
             "cofront": cofront_data
         }
+    except DynamicCofrontExistsError as e:
+        raise HTTPException(status_code=409, detail={"message": str(e), "cofront_id": e.cofront_id})
     except ValueError as ve:
         raise HTTPException(status_code=400, detail=str(ve))
+    except PLURALKIT_RETRY_ERRORS as e:
+        raise pluralkit_retry_exception(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/cofronts")
 async def get_available_cofronts(user = Depends(get_current_user)):
-    """Get all available predefined cofronts"""
+    """Get all available predefined and dynamic cofronts"""
     try:
         # Get all members
         members = await get_members()
@@ -615,48 +912,151 @@ async def get_available_cofronts(user = Depends(get_current_user)):
             "status": "success",
             "cofronts": cofronts
         }
+    except PLURALKIT_RETRY_ERRORS as e:
+        raise pluralkit_retry_exception(e)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/cofronts/dynamic")
+async def list_dynamic_cofronts(user = Depends(get_current_user)):
+    """Get all registered dynamic cofronts"""
+    try:
+        member_index = await get_member_index()
+        cofronts = [
+            member_index.get(definition["id"], definition)
+            for definition in get_dynamic_cofronts()
+        ]
+        
+        return {
+            "status": "success",
+            "cofronts": cofronts
+        }
+    except PLURALKIT_RETRY_ERRORS as e:
+        raise pluralkit_retry_exception(e)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/cofronts/dynamic/{cofront_id}")
+async def dynamic_cofront_detail(cofront_id: str, user = Depends(get_current_user)):
+    """Get a single dynamic cofront"""
+    definition = get_dynamic_cofront(cofront_id)
+    if not definition:
+        raise HTTPException(status_code=404, detail="Dynamic cofront not found")
+    
+    try:
+        member_index = await get_member_index()
+        return {
+            "status": "success",
+            "cofront": member_index.get(cofront_id, definition)
+        }
+    except PLURALKIT_RETRY_ERRORS as e:
+        raise pluralkit_retry_exception(e)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.put("/api/cofronts/dynamic/{cofront_id}")
+async def update_custom_cofront(
+    cofront_id: str,
+    cofront_update: DynamicCofrontUpdate,
+    user = Depends(get_current_user)
+):
+    """Rename a dynamic cofront or change its members"""
+    try:
+        cofront_data = await update_dynamic_cofront(
+            cofront_id,
+            name=cofront_update.name,
+            member_ids=cofront_update.member_ids
+        )
+        if not cofront_data:
+            raise HTTPException(status_code=404, detail="Dynamic cofront not found")
+        
+        await broadcast_cofront_update({
+            "action": "updated",
+            "cofront": cofront_data
+        })
+        
+        return {
+            "status": "success",
+            "message": "Dynamic cofront updated successfully",
+            "cofront": cofront_data
+        }
+    except HTTPException as http_exc:
+        raise http_exc
+    except DynamicCofrontExistsError as e:
+        raise HTTPException(status_code=409, detail={"message": str(e), "cofront_id": e.cofront_id})
+    except ValueError as ve:
+        raise HTTPException(status_code=400, detail=str(ve))
+    except PLURALKIT_RETRY_ERRORS as e:
+        raise pluralkit_retry_exception(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.delete("/api/cofronts/dynamic/{cofront_id}")
+async def remove_custom_cofront(cofront_id: str, user = Depends(get_current_user)):
+    """Delete a dynamic cofront"""
+    if not delete_dynamic_cofront(cofront_id):
+        raise HTTPException(status_code=404, detail="Dynamic cofront not found")
+    
+    await broadcast_cofront_update({
+        "action": "deleted",
+        "cofront_id": cofront_id
+    })
+    
+    return {"status": "success", "message": "Dynamic cofront deleted successfully"}
+
 # ============================================================================
 # SUB-SYSTEM API ENDPOINTS
 # ============================================================================
 
+def subsystems_view():
+    subsystems = get_subsystems()
+    return cached_view("subsystems", (subsystems,), lambda: {
+        "status": "success",
+        "subsystems": [subsystem.dict() for subsystem in subsystems]
+    })
+
 @app.get("/api/subsystems")
-async def list_subsystems():
+async def list_subsystems(request: Request):
     """Get all available sub-systems"""
     try:
-        subsystems = get_subsystems()
-        return {
-            "status": "success",
-            "subsystems": [subsystem.dict() for subsystem in subsystems]
-        }
+        return view_response(request, subsystems_view())
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to fetch sub-systems: {str(e)}")
 
 @app.get("/api/members/by-subsystem")
-async def members_by_subsystem():
+async def members_by_subsystem(request: Request):
     """Get members grouped by their sub-systems"""
     try:
         # Get all members without filtering
         all_members = await get_members()
         
-        # Group by sub-system
-        grouped_members = get_members_by_subsystem(all_members)
-        
-        return {
+        # Group by sub-system, only when members or sub-systems changed
+        return cached_response(request, "by-subsystem", (all_members, get_subsystems()), lambda: {
             "status": "success",
-            "subsystems": grouped_members
-        }
+            "subsystems": get_members_by_subsystem(all_members)
+        }, "members_raw")
+    except PLURALKIT_RETRY_ERRORS as e:
+        raise pluralkit_retry_exception(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to group members by sub-system: {str(e)}")
 
 @app.get("/api/members/filtered")
 async def members_filtered(
+    request: Request,
     subsystem: Optional[str] = None,
-    include_untagged: bool = True
+    include_untagged: bool = True,
+    format: str = "full",
+    fields: Optional[str] = None,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None
 ):
-    """Get members filtered by sub-system"""
+    """Get members filtered by sub-system, optionally with only some fields and paginated"""
+    if format not in FORMATS:
+        raise HTTPException(status_code=400, detail=f"Invalid format. Valid options: {', '.join(FORMATS)}")
+    if limit is not None and limit < 1:
+        raise HTTPException(status_code=400, detail="limit must be at least 1")
+    field_list = parse_fields(fields)
+    
     try:
         # Validate subsystem parameter
         if subsystem:
@@ -671,16 +1071,35 @@ async def members_filtered(
         # Get filtered members
         members = await get_members(subsystem, include_untagged)
         
-        return {
-            "status": "success",
-            "members": members,
-            "filter": {
-                "subsystem": subsystem,
-                "include_untagged": include_untagged
-            }
+        filter_info = {
+            "subsystem": subsystem,
+            "include_untagged": include_untagged
         }
+        
+        try:
+            page, next_cursor = paginate(members, cursor, limit)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        
+        def build():
+            payload = members_payload(page, format, field_list)
+            if format == "normalized":
+                payload = {"status": "success", **payload, "filter": filter_info}
+            else:
+                payload = {"status": "success", "members": payload, "filter": filter_info}
+            # Only paginated requests get a cursor, so the default response is unchanged
+            if limit is not None:
+                payload["next_cursor"] = next_cursor
+            return payload
+        
+        return cached_response(
+            request, f"filtered:{subsystem}:{include_untagged}:{format}:{field_list}:{cursor}:{limit}", (members,),
+            build, "members_raw"
+        )
     except HTTPException as http_exc:
         raise http_exc
+    except PLURALKIT_RETRY_ERRORS as e:
+        raise pluralkit_retry_exception(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to fetch filtered members: {str(e)}")
 
@@ -723,8 +1142,7 @@ async def update_member_tag_list(
         
         if success:
             # Clear member cache to reflect changes
-            from cache import set_in_cache
-            set_in_cache("members_raw", None, 0)
+            invalidate_members()
             
             return {
                 "status": "success",
@@ -761,8 +1179,7 @@ async def add_single_member_tag(
         
         if success:
             # Clear member cache to reflect changes
-            from cache import set_in_cache
-            set_in_cache("members_raw", None, 0)
+            invalidate_members()
             
             return {
                 "status": "success",
@@ -794,8 +1211,7 @@ async def remove_single_member_tag(
         
         if success:
             # Clear member cache to reflect changes
-            from cache import set_in_cache
-            set_in_cache("members_raw", None, 0)
+            invalidate_members()
             
             return {
                 "status": "success",
@@ -811,6 +1227,62 @@ async def remove_single_member_tag(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to remove member tag: {str(e)}")
 
+# ============================================================================
+# BOOTSTRAP API ENDPOINT
+# ============================================================================
+
+def parse_known_versions(known: Optional[str]) -> Dict[str, str]:
+    """?known=part:version,part:version as {part: version}"""
+    versions = {}
+    for item in (known or "").split(","):
+        part, _, version = item.strip().partition(":")
+        if part and version:
+            versions[part] = version
+    return versions
+
+@app.get("/api/bootstrap")
+async def bootstrap(request: Request, known: Optional[str] = None):
+    """
+    System, members, fronters, sub-systems and mental state in one response,
+    fetched concurrently. Each part has a version (its ETag) in "versions";
+    parts whose version the client sends back in known= are left out and
+    listed in "unchanged".
+    """
+    known_versions = parse_known_versions(known)
+    
+    try:
+        system_data, members_data, fronters_data = await asyncio.gather(
+            get_system(), get_members(), get_fronters()
+        )
+        
+        # The same views the individual endpoints serve
+        views = {
+            "system": system_view(system_data),
+            "members": members_view(members_data),
+            "fronters": fronters_view(fronters_data),
+            "subsystems": subsystems_view(),
+            "mental_state": mental_state_view()
+        }
+        versions = {part: view.etag.strip('"') for part, view in views.items()}
+        unchanged = [part for part in views if known_versions.get(part) == versions[part]]
+        
+        def build():
+            payload = {"versions": versions, "unchanged": unchanged}
+            for part, view in views.items():
+                if part not in unchanged:
+                    payload[part] = view.payload
+            return payload
+        
+        stale = sorted(view.headers["X-Data-Stale"] for view in views.values() if "X-Data-Stale" in view.headers)
+        return cached_response(
+            request, f"bootstrap:{','.join(unchanged)}", tuple(views.values()), build,
+            headers={"X-Data-Stale": stale[0]} if stale else None
+        )
+    except PLURALKIT_RETRY_ERRORS as e:
+        raise pluralkit_retry_exception(e)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to fetch bootstrap data: {str(e)}")
+
 # ============================================================================
 # AUTHENTICATION API ENDPOINTS
 # ============================================================================
@@ -907,52 +1379,27 @@ async def upload_user_avatar(
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
-    # Only allow specific file extensions
-    allowed_extensions = ['.jpg', '.jpeg', '.png', '.gif']
-    
     # Get file extension and convert to lowercase
     _, file_ext = os.path.splitext(avatar.filename)
     file_ext = file_ext.lower()
     
-    if file_ext not in allowed_extensions:
+    if file_ext not in ALLOWED_EXTENSIONS:
         raise HTTPException(
             status_code=400,
-            detail=f"Invalid file type. Allowed types are: {', '.join(allowed_extensions)}"
-        )
-    
-    # Validate file size (2MB limit)
-    MAX_SIZE = 2 * 1024 * 1024  # 2MB
-    
-    # First check content-length header
-    content_length = int(avatar.headers.get("content-length", 0))
-    if content_length > MAX_SIZE:
-        raise HTTPException(
-            status_code=413, 
-            detail="File size exceeds the limit of 2MB"
+            detail=f"Invalid file type. Allowed types are: {', '.join(ALLOWED_EXTENSIONS)}"
         )
     
     try:
-        # Ensure DATA_DIR exists
-        DATA_DIR.mkdir(exist_ok=True)
-        print(f"DATA_DIR: {DATA_DIR}")
-        print(f"DATA_DIR exists: {DATA_DIR.exists()}")
-        
-        # Read the file content
-        contents = await avatar.read()
-        file_size = len(contents)
-        
-        # Double-check file size
-        if file_size > MAX_SIZE:
-            raise HTTPException(
-                status_code=413,
-                detail="File size exceeds the limit of 2MB"
-            )
-        
-        # Generate unique filename
-        unique_filename = f"{user_id}_{uuid.uuid4()}{file_ext}"
+        # Copy the spooled upload to disk, checking its size and content on the way
+        # (FileSizeLimitMiddleware already cut off anything over the limit)
+        try:
+            unique_filename = await save_avatar(avatar, user_id, file_ext)
+        except AvatarError as e:
+            raise HTTPException(status_code=e.status_code, detail=str(e))
         file_path = DATA_DIR / unique_filename
         
-        print(f"Saving avatar to: {file_path}")
+        print(f"Avatar saved to: {file_path}")
+        schedule_thumbnails(unique_filename)
         
         # If there's an existing avatar, try to remove it
         users = get_users()
@@ -963,18 +1410,11 @@ async def upload_user_avatar(
                     old_filename = u.avatar_url.split("/")[-1]
                     old_path = DATA_DIR / old_filename
                     if os.path.exists(old_path):
-                        os.remove(old_path)
+                        remove_avatar(old_filename)
                         print(f"Removed old avatar: {old_path}")
                 except Exception as e:
                     print(f"Error removing old avatar: {e}")
         
-        # Save the new file
-        async with aiofiles.open(file_path, 'wb') as out_file:
-            await out_file.write(contents)
-        
-        print(f"Avatar saved successfully")
-        print(f"File exists after save: {os.path.exists(file_path)}")
-        
         # Get the base URL from environment variables
         base_url = os.getenv("BASE_URL", "").rstrip('/')
         if not base_url:
@@ -1008,17 +1448,39 @@ async def upload_user_avatar(
         raise HTTPException(status_code=500, detail=f"Error uploading avatar: {str(e)}")
 
 @app.get("/avatars/{filename}")
-async def get_avatar(filename: str):
-    """Serve avatar images with proper content type handling"""
+async def get_avatar(filename: str, request: Request, size: Optional[int] = None):
+    """Serve avatar images with proper content type handling. size= serves the closest thumbnail."""
+    if size is not None and size < 1:
+        raise HTTPException(status_code=400, detail="size must be at least 1")
+    
     # Sanitize filename to prevent directory traversal
     safe_filename = os.path.basename(filename)
     file_path = DATA_DIR / safe_filename
     
+    # DATA_DIR holds other data too (users, cofronts, ...), only avatars are public
+    if not is_avatar_or_thumbnail(safe_filename):
+        print(f"Refusing to serve non-avatar file: {safe_filename}")
+        raise HTTPException(status_code=404, detail=f"Avatar not found: {safe_filename}")
+    
     print(f"Avatar request for: {safe_filename}")
     print(f"Looking in: {file_path}")
     print(f"File exists: {os.path.exists(file_path)}")
     
     if os.path.exists(file_path) and os.path.isfile(file_path):
+        headers = {
+            "Cache-Control": "public, max-age=3600",
+            "Access-Control-Allow-Origin": "*"
+        }
+        
+        if size is not None:
+            # The response depends on whether WebP is accepted
+            headers["Vary"] = "Accept"
+            thumbnail = find_thumbnail(safe_filename, size, request.headers.get("accept"))
+            if thumbnail:
+                thumb_path, media_type = thumbnail
+                return FileResponse(path=thumb_path, media_type=media_type, headers=headers)
+            # Not made yet (see backfill_thumbnails at startup), serve the original meanwhile
+        
         # Set the appropriate media type based on file extension
         media_type = None
         if safe_filename.lower().endswith(('.jpg', '.jpeg')):
@@ -1027,6 +1489,8 @@ async def get_avatar(filename: str):
             media_type = "image/png"
         elif safe_filename.lower().endswith('.gif'):
             media_type = "image/gif"
+        elif safe_filename.lower().endswith('.webp'):
+            media_type = "image/webp"
         else:
             # Default to octet-stream for unknown types
             media_type = "application/octet-stream"
@@ -1036,15 +1500,11 @@ async def get_avatar(filename: str):
         return FileResponse(
             path=file_path,
             media_type=media_type,
-            headers={
-                "Cache-Control": "public, max-age=3600",
-                "Access-Control-Allow-Origin": "*"
-            }
+            headers=headers
         )
     
     # File not found - log details and return 404
     print(f"Avatar not found: {safe_filename}")
-    print(f"DATA_DIR contents: {list(DATA_DIR.iterdir()) if DATA_DIR.exists() else 'DATA_DIR does not exist'}")
     
     # Instead of redirecting to default, return a proper 404
     raise HTTPException(
@@ -1057,11 +1517,24 @@ async def get_avatar(filename: str):
 # ============================================================================
 
 @app.get("/api/metrics/fronting-time")
-async def fronting_time_metrics(days: int = 30, user = Depends(get_current_user)):
-    """Get fronting time metrics for each member over different timeframes"""
+async def fronting_time_metrics(
+    days: int = 30,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    user = Depends(get_current_user)
+):
+    """Get fronting time metrics for each member over different timeframes, plus an optional custom range"""
     try:
-        metrics = await get_fronting_time_metrics(days)
-        return metrics
+        start_dt = parse_timestamp(start) if start else None
+        end_dt = parse_timestamp(end) if end else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="start and end must be ISO 8601 timestamps")
+
+    try:
+        metrics = await get_fronting_time_metrics(days, start_dt, end_dt)
+        return with_stale_flag(metrics, "switches")
+    except PLURALKIT_RETRY_ERRORS as e:
+        raise pluralkit_retry_exception(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to fetch fronting metrics: {str(e)}")
 
@@ -1070,10 +1543,47 @@ async def switch_frequency_metrics(days: int = 30, user = Depends(get_current_us
     """Get switch frequency metrics over different timeframes"""
     try:
         metrics = await get_switch_frequency_metrics(days)
-        return metrics
+        return with_stale_flag(metrics, "switches")
+    except PLURALKIT_RETRY_ERRORS as e:
+        raise pluralkit_retry_exception(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to fetch switch frequency metrics: {str(e)}")
 
+@app.get("/api/metrics/cofronting")
+async def cofronting_metrics(
+    days: int = 30,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    limit: int = 10,
+    user = Depends(get_current_user)
+):
+    """Get how long each pair of members fronted together, and the most common fronting groups"""
+    try:
+        start_dt = parse_timestamp(start) if start else None
+        end_dt = parse_timestamp(end) if end else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="start and end must be ISO 8601 timestamps")
+
+    try:
+        metrics = await get_cofronting_metrics(days, start_dt, end_dt, max(limit, 0))
+        return with_stale_flag(metrics, "switches")
+    except PLURALKIT_RETRY_ERRORS as e:
+        raise pluralkit_retry_exception(e)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to fetch cofronting metrics: {str(e)}")
+
+@app.get("/api/metrics/heatmap")
+async def heatmap_metrics(tz: str = "UTC", user = Depends(get_current_user)):
+    """Get fronting time per member by day of week and hour of day in the given timezone"""
+    try:
+        return with_stale_flag(await get_heatmap_metrics(tz), "switches")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except PLURALKIT_RETRY_ERRORS as e:
+        raise pluralkit_retry_exception(e)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to fetch heatmap metrics: {str(e)}")
+
 # ============================================================================
 # ADMIN UTILITY ENDPOINTS
 # ============================================================================
@@ -1094,6 +1604,22 @@ async def admin_refresh(user = Depends(get_current_user)):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to broadcast refresh: {str(e)}")
 
+@app.get("/api/admin/pluralkit")
+async def pluralkit_stats(user = Depends(get_current_user)):
+    """Get PluralKit request budget and queue stats (admin only)"""
+    if not user.is_admin:
+        raise HTTPException(status_code=403, detail="Admin privileges required")
+    
+    return {
+        "status": "success",
+        "pluralkit": pk_client.stats(),
+        "switch_queue": {
+            "window_seconds": switch_queue.window,
+            **switch_queue.stats
+        },
+        "switch_history": get_switch_store_stats()
+    }
+
 # ============================================================================
 # DYNAMIC EMBEDS ENDPOINTS
 # ============================================================================
@@ -1111,88 +1637,22 @@ async def serve_member_page(member_name: str, request: Request):
     if any(member_name.startswith(route) for route in skip_routes):
         raise HTTPException(status_code=404)
     
-    # Hex normalization helper (compatible with Python < 3.10)
-    def normalize_hex(color: Optional[str], default: str = "#FF69B4") -> str:
-        # Require a string input
-        if not isinstance(color, str) or not color:
-            return default
-        c = color.lstrip("#")
-        if len(c) == 6 and all(ch in "0123456789abcdefABCDEF" for ch in c):
-            return f"#{c.upper()}"
-        return default
+    # Prerendered pages skip member lookup and rendering entirely
+    if (prerendered := prerendered_page_path(member_name)):
+        return FileResponse(prerendered, media_type="text/html", headers={"Cache-Control": "public, max-age=60"})
     
     try:
-        members = await get_members()
-        member = None
-        
-        for m in members:
-            if m.get("name", "").lower() == member_name.lower():
-                member = m
-                break
-        
-        if not member:
+        page = await render_member_page(member_name)
+        if page is None:
             return FileResponse(STATIC_DIR / "index.html")
-
-        raw_color = member.get("color") or "#FF69B4" # Default to hot pink
-        color = normalize_hex(raw_color)
-        pronouns = member.get("pronouns") or f"they/them"
-        display_name = member.get("display_name") or member.get("name")
-        description = member.get("description") or f"Member of the Doughmination System®"
-        avatar_url = member.get("avatar_url") or "https://www.yuri-lover.win/cdn/pfp/fallback_avatar.png"
-        
-        # Escape
-        color = color.replace('"', '&quot;')
-        pronouns = pronouns.replace('"', '&quot;')
-        display_name = display_name.replace('"', '&quot;')
-        description = description.replace('"', '&quot;')
         
-        # Read index.html from where your frontend is built
-        # You'll need to copy the built frontend to the backend container
-        index_path = STATIC_DIR / "index.html"
-        with open(index_path, "r", encoding="utf-8") as f:
-            html_content = f.read()
-        
-        meta_head = f"""
-<head>
-    <meta charset="UTF-8" />
-    <meta name="viewport" content="width=device-width, initial-scale=1.0, maximum-scale=5.0">
-
-    <title>{display_name} - {pronouns}</title>
-
-    <!-- iOS Safari Meta Tags -->
-    <meta name="apple-mobile-web-app-title" content="{display_name}" />
-    <meta name="apple-mobile-web-app-status-bar-style" content="black-translucent" />
-    <meta name="apple-mobile-web-app-capable" content="yes" />
-    <link rel="apple-touch-icon" href="{avatar_url}" />
-
-    <!-- Primary Meta Tags -->
-    <meta property="og:site_name" content="Doughmination System®" />
-    <meta property="og:title" content="{display_name} - {pronouns}" />
-    <meta property="og:description" content="{description}" />
-    <meta property="og:image" content="{avatar_url}" />
-    <meta property="og:image:width" content="400" />
-    <meta property="og:image:height" content="400" />
-    <meta property="og:type" content="profile" />
-    <meta property="og:url" content="https://www.doughmination.win/{member_name}" />
-    <meta name="theme-color" content="{color}" />
-
-    <!-- Twitter Meta Tags -->
-    <meta name="twitter:card" content="summary" />
-    <meta name="twitter:title" content="{display_name} - {pronouns}" />
-    <meta name="twitter:description" content="{description}" />
-    <meta name="twitter:image" content="{avatar_url}" />
-</head>
-"""
-
-        
-        html_content = re.sub(
-    r"<head>.*?</head>",
-    meta_head,
-    html_content,
-    flags=re.DOTALL
-)
+        # Crawlers unfurling the same link in bursts get the cached page
+        html_content, etag = page
+        headers = {"ETag": etag, "Cache-Control": "public, max-age=60"}
+        if request.headers.get("if-none-match") == etag:
+            return Response(status_code=304, headers=headers)
         
-        return HTMLResponse(content=html_content)
+        return HTMLResponse(content=html_content, headers=headers)
         
     except Exception as e:
         print(f"Error: {e}")
@@ -0,0 +1,145 @@
+import bisect
+import json
+import os
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+from models import MentalState
+from timestamps import datetime_to_epoch_us
+
+# Define data directory
+DATA_DIR = Path("dough-data")
+# Kept in a subdirectory, out of reach of /avatars/, which serves files in DATA_DIR by name
+PRIVATE_DIR = DATA_DIR / "private"
+MENTAL_STATE_LOG = PRIVATE_DIR / "mental_state_log.jsonl"
+# Where the log used to be
+LEGACY_MENTAL_STATE_LOG = DATA_DIR / "mental_state_log.jsonl"
+# Single-state file used before the log; read once to seed the log
+MENTAL_STATE_FILE = DATA_DIR / "mental_state.json"
+
+# Ensure data directory exists
+PRIVATE_DIR.mkdir(parents=True, exist_ok=True)
+
+# Move a log left in the old location
+if LEGACY_MENTAL_STATE_LOG.exists() and not MENTAL_STATE_LOG.exists():
+    os.replace(LEGACY_MENTAL_STATE_LOG, MENTAL_STATE_LOG)
+
+# Cap on entries returned by a single history query
+MAX_HISTORY_ENTRIES = 1000
+
+# Current state, and every logged change sorted by updated_at (with epoch microseconds alongside for bisect)
+_current: Optional[MentalState] = None
+_history: List[Dict[str, Any]] = []
+_history_us: List[int] = []
+_loaded = False
+_version = 0
+
+
+def _entry_us(entry: Dict[str, Any]) -> int:
+    dt = datetime.fromisoformat(entry["updated_at"])
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return datetime_to_epoch_us(dt)
+
+
+def _to_state(entry: Dict[str, Any]) -> MentalState:
+    return MentalState(**{**entry, "updated_at": datetime.fromisoformat(entry["updated_at"])})
+
+
+def _add(entry: Dict[str, Any]):
+    """Add an entry to the in-memory history, keeping it sorted by updated_at"""
+    entry_us = _entry_us(entry)
+    position = bisect.bisect_right(_history_us, entry_us)
+    _history_us.insert(position, entry_us)
+    _history.insert(position, entry)
+
+
+def _append_to_log(entry: Dict[str, Any]):
+    with open(MENTAL_STATE_LOG, "a") as f:
+        f.write(json.dumps(entry) + "\n")
+
+
+def _load():
+    global _current, _loaded
+    if _loaded:
+        return
+    _loaded = True
+
+    last = None
+    if os.path.exists(MENTAL_STATE_LOG):
+        with open(MENTAL_STATE_LOG, "r") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    entry = json.loads(line)
+                    _add(entry)
+                    last = entry
+                except Exception as e:
+                    # A torn write leaves at most the last line unreadable
+                    print(f"Skipping unreadable mental state log entry: {e}")
+    elif os.path.exists(MENTAL_STATE_FILE):
+        try:
+            with open(MENTAL_STATE_FILE, "r") as f:
+                last = json.load(f)
+            _add(last)
+            _append_to_log(last)
+        except Exception as e:
+            print(f"Error loading mental state: {e}")
+            last = None
+
+    if last is not None:
+        try:
+            _current = _to_state(last)
+        except Exception as e:
+            print(f"Error loading mental state: {e}")
+
+    if _current is None:
+        # Default state
+        _current = MentalState(level="safe", updated_at=datetime.now(timezone.utc), notes=None)
+
+
+def get_current_mental_state() -> MentalState:
+    """The current mental state, defaulting to safe"""
+    _load()
+    return _current
+
+
+def get_mental_state_version() -> int:
+    """Changes whenever the mental state is updated"""
+    return _version
+
+
+def set_mental_state(state: MentalState) -> Dict[str, Any]:
+    """Make state the current mental state and append it to the log. Returns the logged entry."""
+    global _current, _version
+    _load()
+
+    entry = state.dict()
+    entry["updated_at"] = entry["updated_at"].isoformat()
+
+    _append_to_log(entry)
+    _add(entry)
+    _current = state
+    _version += 1
+    return entry
+
+
+def get_mental_state_history(
+    start_us: Optional[int] = None,
+    end_us: Optional[int] = None,
+    limit: int = MAX_HISTORY_ENTRIES
+) -> Dict[str, Any]:
+    """Mental state changes with updated_at in [start, end), oldest first"""
+    _load()
+    lo = bisect.bisect_left(_history_us, start_us) if start_us is not None else 0
+    hi = bisect.bisect_left(_history_us, end_us) if end_us is not None else len(_history)
+
+    limit = max(1, min(limit, MAX_HISTORY_ENTRIES))
+    # Keep the most recent entries when the range has more than limit
+    entries = _history[max(lo, hi - limit):hi]
+    return {
+        "entries": entries,
+        "count": len(entries),
+        "truncated": hi - lo > len(entries)
+    }
@@ -1,234 +1,130 @@
-from datetime import datetime, timedelta, timezone
-import httpx
+import math
 import os
+import time
+from datetime import datetime, timedelta, timezone
+from bisect import bisect_left, bisect_right
+from itertools import combinations
 from dotenv import load_dotenv
-from cache import get_from_cache, set_in_cache
-from typing import List, Dict, Any, Optional
+from typing import Dict, Any, List, Optional, Tuple
+from timestamps import datetime_to_epoch_us
+from timeline import get_timeline
+from rollups import FrontingRollups, get_rollups
+from heatmap import get_heatmap
 import traceback
-import re
 
 load_dotenv()
 
-BASE_URL = "https://api.pluralkit.me/v2"
-TOKEN = os.getenv("SYSTEM_TOKEN")
 CACHE_TTL = int(os.getenv("CACHE_TTL", 30))
 
-HEADERS = {
-    "Authorization": TOKEN
-}
+US_PER_SECOND = 1_000_000
 
-def parse_timestamp(timestamp_str: str) -> datetime:
-    """Parse timestamp string into datetime with proper timezone handling"""
-    try:
-        # Handle Z timezone
-        if timestamp_str.endswith('Z'):
-            timestamp_str = timestamp_str[:-1] + '+00:00'
-        
-        # Try direct parsing first
-        try:
-            dt = datetime.fromisoformat(timestamp_str)
-        except ValueError:
-            # If direct parsing fails, try handling microsecond precision issues
-            match = re.match(r'(\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}\.\d+)(\+\d{2}:\d{2})', timestamp_str)
-            if match:
-                # Truncate microseconds to 6 digits and rebuild the string
-                base = match.group(1)
-                if len(base.split('.')[-1]) > 6:
-                    base = base.split('.')[0] + '.' + base.split('.')[-1][:6]
-                timestamp_str = f"{base}{match.group(2)}"
-                dt = datetime.fromisoformat(timestamp_str)
-            else:
-                # Try another approach for microsecond issues
-                parts = timestamp_str.split('.')
-                if len(parts) == 2 and '+' in parts[1]:
-                    ms_part, tz_part = parts[1].split('+', 1)
-                    if len(ms_part) > 6:
-                        ms_part = ms_part[:6]
-                    timestamp_str = f"{parts[0]}.{ms_part}+{tz_part}"
-                    dt = datetime.fromisoformat(timestamp_str)
-                else:
-                    raise ValueError(f"Could not parse timestamp: {timestamp_str}")
-        
-        # Ensure it's timezone-aware
-        if dt.tzinfo is None:
-            dt = dt.replace(tzinfo=timezone.utc)
-        
-        return dt
-    except Exception as e:
-        print(f"Error parsing timestamp {timestamp_str}: {str(e)}")
-        raise
+# Cofronting results for the current switch data version: (days, start, end, limit) -> (expires, result)
+_cofronting_cache: Dict[tuple, Tuple[float, Dict[str, Any]]] = {}
+_cofronting_version = None
+MAX_COFRONTING_CACHE = 64
+
+# Reported timeframes and their length in seconds
+TIMEFRAMES = {
+    "24h": 24 * 3600,
+    "48h": 48 * 3600,
+    "5d": 5 * 24 * 3600,
+    "7d": 7 * 24 * 3600,
+    "30d": 30 * 24 * 3600
+}
 
-async def get_switches(limit: int = 1000) -> List[Dict[str, Any]]:
-    """Get recent switches from PluralKit"""
+async def get_member_details() -> Dict[str, Dict[str, Any]]:
+    """Names and avatars by member ID for display purposes; empty if PluralKit can't be reached"""
+    member_details = {}
     try:
-        cache_key = f"switches_{limit}"
-        if (cached := get_from_cache(cache_key)):
-            return cached
-        
-        print(f"Fetching switches from PluralKit API, limit={limit}")
-        async with httpx.AsyncClient() as client:
-            resp = await client.get(f"{BASE_URL}/systems/@me/switches?limit={limit}", headers=HEADERS)
-            resp.raise_for_status()
-            data = resp.json()
-            print(f"Received {len(data)} switches from API")
-            set_in_cache(cache_key, data, CACHE_TTL)
-            return data
+        from pluralkit import get_members
+        members = await get_members()
+        print(f"Retrieved {len(members)} members for details")
+        for member in members:
+            member_details[member["id"]] = {
+                "name": member["name"],
+                "display_name": member.get("display_name", member["name"]),
+                "avatar_url": member.get("avatar_url", None)
+            }
     except Exception as e:
-        print(f"Error in get_switches: {str(e)}")
+        print(f"Error fetching member details: {e}")
         print(traceback.format_exc())
-        # Return empty list instead of failing
-        return []
+    return member_details
+
+def _fronting_range(rollups: FrontingRollups, start: datetime, end: datetime, now_us: int) -> Dict[str, Any]:
+    total_us, member_us = rollups.fronting_us(datetime_to_epoch_us(start), datetime_to_epoch_us(end), now_us)
+    return {
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "total_seconds": total_us / US_PER_SECOND,
+        "members": {member_id: us / US_PER_SECOND for member_id, us in member_us.items()}
+    }
 
-async def get_fronting_time_metrics(days: int = 30) -> Dict[str, Any]:
-    """Calculate fronting time metrics for each member"""
+async def get_fronting_range(start: datetime, end: datetime) -> Dict[str, Any]:
+    """Fronting seconds per member between start and end, summed from the hourly/daily rollups"""
+    rollups = await get_rollups()
+    return _fronting_range(rollups, start, end, datetime_to_epoch_us(datetime.now(timezone.utc)))
+
+async def get_fronting_time_metrics(
+    days: int = 30,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None
+) -> Dict[str, Any]:
+    """
+    Calculate fronting time metrics for each member, summed from the
+    hourly/daily rollups: fronting time within the last `days` days and
+    within each timeframe (capped to those days).
+    
+    "range" holds the time actually fronted between start and end, which
+    default to the last `days` days.
+    """
+    now = datetime.now(timezone.utc)
+    range_start, range_end = start or now - timedelta(days=days), end or now
+    
     try:
         print(f"Calculating fronting metrics for past {days} days")
-        # Get all switches for the specified period
-        switches = await get_switches(1000)  # Get a large number of switches
-        print(f"Retrieved {len(switches)} switches")
+        rollups = await get_rollups()
         
         # Get current time and calculate the cutoff time
-        now = datetime.now(timezone.utc)
-        cutoff_time = now - timedelta(days=days)
-        print(f"Cutoff time: {cutoff_time.isoformat()}")
-        
-        # Get member details for display purposes
-        member_details = {}
-        try:
-            from pluralkit import get_members
-            members = await get_members()
-            print(f"Retrieved {len(members)} members for details")
-            for member in members:
-                member_details[member["id"]] = {
-                    "name": member["name"],
-                    "display_name": member.get("display_name", member["name"]),
-                    "avatar_url": member.get("avatar_url", None)
-                }
-        except Exception as e:
-            print(f"Error fetching member details: {e}")
-            print(traceback.format_exc())
-        
-        # Filter switches to only include those within the specified period
-        filtered_switches = []
-        for switch in switches:
-            try:
-                timestamp = parse_timestamp(switch["timestamp"])
-                if timestamp >= cutoff_time:
-                    filtered_switches.append({
-                        **switch,
-                        "_parsed_timestamp": timestamp  # Store the parsed timestamp
-                    })
-            except Exception as e:
-                print(f"Error parsing timestamp {switch.get('timestamp', 'unknown')}: {str(e)}")
-                continue
-        
-        print(f"Filtered to {len(filtered_switches)} switches within time period")
+        now_us = datetime_to_epoch_us(now)
+        cutoff_us = now_us - days * 24 * 3600 * US_PER_SECOND
         
-        # Sort switches by timestamp (oldest first)
-        filtered_switches.sort(key=lambda x: x["_parsed_timestamp"])
+        fronting_range = _fronting_range(rollups, range_start, range_end, now_us)
+        total_us, member_us = rollups.fronting_us(cutoff_us, now_us, now_us)
         
-        # Calculate fronting time for each member
-        fronting_times = {}
+        # If nobody fronted in the period, return empty metrics
+        if not member_us:
+            print("No fronting found in the specified time period")
+            return {**_empty_fronting_metrics(), "range": fronting_range}
         
-        # If there are no switches in the period, return empty metrics
-        if not filtered_switches:
-            print("No switches found in the specified time period")
-            return {
-                "total_time": 0,
-                "members": {},
-                "timeframes": {
-                    "24h": {},
-                    "48h": {},
-                    "5d": {},
-                    "7d": {},
-                    "30d": {}
-                }
-            }
-        
-        # Add a virtual "current" switch to include time up to now
-        current_members = filtered_switches[-1]["members"]
-        filtered_switches.append({
-            "timestamp": now.isoformat(),
-            "members": current_members,
-            "_parsed_timestamp": now
-        })
+        window_us = {
+            name: rollups.fronting_us(max(cutoff_us, now_us - seconds * US_PER_SECOND), now_us, now_us)[1]
+            for name, seconds in TIMEFRAMES.items()
+        }
         
-        # Calculate total time for each member
-        total_time_seconds = 0
-        for i in range(1, len(filtered_switches)):
-            prev_switch = filtered_switches[i-1]
-            curr_switch = filtered_switches[i]
-            
-            try:
-                # Use the parsed timestamps
-                prev_time = prev_switch["_parsed_timestamp"]
-                curr_time = curr_switch["_parsed_timestamp"]
-                
-                # Calculate duration in seconds
-                duration_seconds = (curr_time - prev_time).total_seconds()
-                total_time_seconds += duration_seconds
-                
-                # Add duration to each member that was fronting
-                for member_id in prev_switch["members"]:
-                    if member_id not in fronting_times:
-                        fronting_times[member_id] = {
-                            "total_seconds": 0,
-                            "24h": 0,
-                            "48h": 0,
-                            "5d": 0,
-                            "7d": 0,
-                            "30d": 0
-                        }
-                    
-                    fronting_times[member_id]["total_seconds"] += duration_seconds
-                    
-                    # Check which timeframes this duration falls into
-                    time_ago = (now - prev_time).total_seconds()
-                    
-                    if time_ago <= 24 * 3600:  # 24 hours
-                        fronting_times[member_id]["24h"] += duration_seconds
-                    
-                    if time_ago <= 48 * 3600:  # 48 hours
-                        fronting_times[member_id]["48h"] += duration_seconds
-                    
-                    if time_ago <= 5 * 24 * 3600:  # 5 days
-                        fronting_times[member_id]["5d"] += duration_seconds
-                    
-                    if time_ago <= 7 * 24 * 3600:  # 7 days
-                        fronting_times[member_id]["7d"] += duration_seconds
-                    
-                    if time_ago <= 30 * 24 * 3600:  # 30 days
-                        fronting_times[member_id]["30d"] += duration_seconds
-            except Exception as e:
-                print(f"Error processing switch {i}: {str(e)}")
-                print(f"Previous switch timestamp: {prev_switch.get('timestamp', 'unknown')}")
-                print(f"Current switch timestamp: {curr_switch.get('timestamp', 'unknown')}")
-                print(traceback.format_exc())
-                continue
+        # Get member details for display purposes
+        member_details = await get_member_details()
+        total_time_seconds = total_us / US_PER_SECOND
         
         # Format the result
         result = {
             "total_time": total_time_seconds,
+            "range": fronting_range,
             "members": {},
-            "timeframes": {
-                "24h": {},
-                "48h": {},
-                "5d": {},
-                "7d": {},
-                "30d": {}
-            }
+            "timeframes": {name: {} for name in TIMEFRAMES}
         }
         
-        for member_id, times in fronting_times.items():
-            # Get member name and other details
-            name = member_id
-            display_name = member_id
-            avatar_url = None
+        for member_id, us in member_us.items():
+            # Members who didn't front in a timeframe get int 0
+            times = {
+                "total_seconds": us / US_PER_SECOND,
+                **{
+                    name: window_us[name][member_id] / US_PER_SECOND if member_id in window_us[name] else 0
+                    for name in TIMEFRAMES
+                }
+            }
             
-            if member_id in member_details:
-                name = member_details[member_id]["name"]
-                display_name = member_details[member_id]["display_name"]
-                avatar_url = member_details[member_id]["avatar_url"]
+            # Get member name and other details
+            details = member_details.get(member_id, {"name": member_id, "display_name": member_id, "avatar_url": None})
             
             # Calculate percentages
             total_percent = (times["total_seconds"] / total_time_seconds) * 100 if total_time_seconds > 0 else 0
@@ -236,24 +132,17 @@ async def get_fronting_time_metrics(days: int = 30) -> Dict[str, Any]:
             # Add to result
             result["members"][member_id] = {
                 "id": member_id,
-                "name": name,
-                "display_name": display_name,
-                "avatar_url": avatar_url,
+                "name": details["name"],
+                "display_name": details["display_name"],
+                "avatar_url": details["avatar_url"],
                 "total_seconds": times["total_seconds"],
                 "total_percent": total_percent,
-                "24h": times["24h"],
-                "48h": times["48h"],
-                "5d": times["5d"],
-                "7d": times["7d"],
-                "30d": times["30d"]
+                **{name: times[name] for name in TIMEFRAMES}
             }
             
             # Add to timeframes for easier processing
-            result["timeframes"]["24h"][member_id] = times["24h"]
-            result["timeframes"]["48h"][member_id] = times["48h"]
-            result["timeframes"]["5d"][member_id] = times["5d"]
-            result["timeframes"]["7d"][member_id] = times["7d"]
-            result["timeframes"]["30d"][member_id] = times["30d"]
+            for name in TIMEFRAMES:
+                result["timeframes"][name][member_id] = times[name]
         
         print(f"Successfully calculated metrics for {len(result['members'])} members")
         return result
@@ -261,73 +150,36 @@ async def get_fronting_time_metrics(days: int = 30) -> Dict[str, Any]:
         print(f"Error in get_fronting_time_metrics: {str(e)}")
         print(traceback.format_exc())
         # Return a basic structure so the frontend doesn't crash
-        return {
-            "total_time": 0,
-            "members": {},
-            "timeframes": {
-                "24h": {},
-                "48h": {},
-                "5d": {},
-                "7d": {},
-                "30d": {}
-            }
-        }
+        return {**_empty_fronting_metrics(), "range": _empty_fronting_range(range_start, range_end)}
+
+def _empty_fronting_metrics() -> Dict[str, Any]:
+    return {
+        "total_time": 0,
+        "members": {},
+        "timeframes": {name: {} for name in TIMEFRAMES}
+    }
+
+def _empty_fronting_range(start: datetime, end: datetime) -> Dict[str, Any]:
+    return {"start": start.isoformat(), "end": end.isoformat(), "total_seconds": 0, "members": {}}
 
 async def get_switch_frequency_metrics(days: int = 30) -> Dict[str, Any]:
     """Calculate switch frequency metrics"""
     try:
-        # Get all switches for the specified period
-        switches = await get_switches(1000)  # Get a large number of switches
+        timeline = await get_timeline()
+        timestamps = timeline.timestamps
         
         # Get current time and calculate the cutoff time
-        now = datetime.now(timezone.utc)
-        cutoff_time = now - timedelta(days=days)
-        
-        # Filter switches to only include those within the specified period
-        filtered_switches = []
-        for switch in switches:
-            try:
-                timestamp = parse_timestamp(switch["timestamp"])
-                if timestamp >= cutoff_time:
-                    filtered_switches.append({
-                        **switch,
-                        "_parsed_timestamp": timestamp
-                    })
-            except Exception as e:
-                print(f"Error parsing timestamp in switch_frequency: {str(e)}")
-                continue
-        
-        # Calculate metrics
-        total_switches = len(filtered_switches)
+        now_us = datetime_to_epoch_us(datetime.now(timezone.utc))
+        cutoff_us = now_us - days * 24 * 3600 * US_PER_SECOND
         
-        # Calculate switches per day for the last specified days
-        timeframes = {
-            "24h": 0,
-            "48h": 0,
-            "5d": 0,
-            "7d": 0,
-            "30d": total_switches
-        }
+        # Switches are sorted, so each count is a binary search
+        total_switches = len(timestamps) - bisect_left(timestamps, cutoff_us)
         
-        for switch in filtered_switches:
-            try:
-                timestamp = switch["_parsed_timestamp"]
-                time_ago = (now - timestamp).total_seconds()
-                
-                if time_ago <= 24 * 3600:  # 24 hours
-                    timeframes["24h"] += 1
-                
-                if time_ago <= 48 * 3600:  # 48 hours
-                    timeframes["48h"] += 1
-                
-                if time_ago <= 5 * 24 * 3600:  # 5 days
-                    timeframes["5d"] += 1
-                
-                if time_ago <= 7 * 24 * 3600:  # 7 days
-                    timeframes["7d"] += 1
-            except Exception as e:
-                print(f"Error calculating timeframes: {str(e)}")
-                continue
+        timeframes = {}
+        for name, seconds in TIMEFRAMES.items():
+            window_start = max(cutoff_us, now_us - seconds * US_PER_SECOND)
+            timeframes[name] = len(timestamps) - bisect_left(timestamps, window_start)
+        timeframes["30d"] = total_switches
         
         # Calculate average switches per day
         avg_switches_per_day = total_switches / days if days > 0 else 0
@@ -351,4 +203,124 @@ async def get_switch_frequency_metrics(days: int = 30) -> Dict[str, Any]:
                 "7d": 0,
                 "30d": 0
             }
-        }
\ No newline at end of file
+        }
+
+async def get_cofronting_metrics(
+    days: int = 30,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    limit: int = 10
+) -> Dict[str, Any]:
+    """
+    How long each pair of members fronted together, and the most common
+    fronting groups, between start and end (default: the last `days` days).
+    
+    Results are cached per switch data version and window. Windows
+    entirely in the past stay cached until switches change; others, whose
+    edges move with the current time, for CACHE_TTL seconds.
+    """
+    global _cofronting_version
+    timeline = await get_timeline()
+    if timeline.version != _cofronting_version:
+        _cofronting_cache.clear()
+        _cofronting_version = timeline.version
+    
+    key = (None if start else days, start, end, limit)
+    cached = _cofronting_cache.get(key)
+    if cached and cached[0] > time.monotonic():
+        return cached[1]
+    fixed_window = start is not None and end is not None and end <= datetime.now(timezone.utc)
+    
+    switch_groups, group_members = timeline.groups()
+    timestamps = timeline.timestamps
+    count = len(timeline)
+    
+    now = datetime.now(timezone.utc)
+    now_us = datetime_to_epoch_us(now)
+    start = start or now - timedelta(days=days)
+    end = min(end or now, now)
+    start_us, end_us = datetime_to_epoch_us(start), datetime_to_epoch_us(end)
+    
+    # One pass over the switches overlapping the window, totalling time per group
+    group_us: Dict[int, int] = {}
+    group_switches: Dict[int, int] = {}
+    i = max(bisect_right(timestamps, start_us) - 1, 0)
+    while i < count and timestamps[i] < end_us:
+        group = switch_groups[i]
+        if len(group_members[group]) > 1:
+            interval_end = timestamps[i + 1] if i + 1 < count else now_us
+            overlap = min(interval_end, end_us) - max(timestamps[i], start_us)
+            if overlap > 0:
+                group_us[group] = group_us.get(group, 0) + overlap
+                if timestamps[i] >= start_us:
+                    group_switches[group] = group_switches.get(group, 0) + 1
+        i += 1
+    
+    # Every pair within a group fronted together for the group's whole time
+    pair_us: Dict[Tuple[int, int], int] = {}
+    for group, us in group_us.items():
+        for pair in combinations(group_members[group], 2):
+            pair_us[pair] = pair_us.get(pair, 0) + us
+    
+    def member_ids(indexes) -> List[str]:
+        return sorted(timeline.member_ids[m] for m in indexes)
+    
+    pairs = [
+        {"members": member_ids(pair), "seconds": us / US_PER_SECOND}
+        for pair, us in sorted(pair_us.items(), key=lambda item: item[1], reverse=True)
+    ]
+    top_groups = sorted(group_us.items(), key=lambda item: item[1], reverse=True)[:limit]
+    groups = [
+        {
+            "members": member_ids(group_members[group]),
+            "seconds": us / US_PER_SECOND,
+            "switches": group_switches.get(group, 0)
+        }
+        for group, us in top_groups
+    ]
+    
+    # Details for every member that appears, for display purposes
+    member_details = await get_member_details()
+    seen = {member_id for pair in pairs for member_id in pair["members"]}
+    members = {
+        member_id: {"id": member_id, **member_details.get(member_id, {"name": member_id, "display_name": member_id, "avatar_url": None})}
+        for member_id in sorted(seen)
+    }
+    
+    result = {
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "total_seconds": max(end_us - start_us, 0) / US_PER_SECOND,
+        "pairs": pairs,
+        "groups": groups,
+        "members": members
+    }
+    
+    if len(_cofronting_cache) >= MAX_COFRONTING_CACHE:
+        _cofronting_cache.pop(next(iter(_cofronting_cache)))
+    _cofronting_cache[key] = (math.inf if fixed_window else time.monotonic() + CACHE_TTL, result)
+    return result
+
+DAYS_OF_WEEK = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+
+async def get_heatmap_metrics(tz: str = "UTC") -> Dict[str, Any]:
+    """
+    Fronting seconds per member by day of week and hour of day in the given
+    timezone, over the whole switch history. Raises ValueError for unknown timezones.
+    """
+    heatmap = await get_heatmap(tz)
+    member_seconds = heatmap.seconds(datetime_to_epoch_us(datetime.now(timezone.utc)))
+    member_details = await get_member_details()
+    
+    return {
+        "timezone": tz,
+        "days": DAYS_OF_WEEK,
+        "members": {
+            member_id: {
+                "id": member_id,
+                **member_details.get(member_id, {"name": member_id, "display_name": member_id, "avatar_url": None}),
+                "seconds": seconds
+            }
+            for member_id, seconds in member_seconds.items()
+        }
+    }
@@ -68,6 +68,11 @@ class DynamicCofrontCreate(BaseModel):
     name: Optional[str] = None
     set_as_current: bool = False
 
+class DynamicCofrontUpdate(BaseModel):
+    """Model for renaming a dynamic cofront or changing its members"""
+    name: Optional[str] = None
+    member_ids: Optional[List[str]] = None
+
 class CofrontResponse(BaseModel):
     """Model for cofront information"""
     is_cofront: bool = True
@@ -0,0 +1,111 @@
+from typing import Any, Dict, List, Optional, Tuple
+
+# Response formats accepted by ?format=
+FORMATS = ("full", "normalized")
+
+# Member lists we have an ID -> position index for, keyed by id(list)
+_positions: Dict[int, Tuple[List[Dict[str, Any]], Dict[str, int]]] = {}
+MAX_POSITION_INDEXES = 16
+
+# Fields moved out of each member in the normalized format
+_MOVED_FIELDS = ("component_members", "tags")
+
+
+def _normalize_member(member: Dict[str, Any]) -> Dict[str, Any]:
+    normalized = {key: value for key, value in member.items() if key not in _MOVED_FIELDS}
+    if "component_members" in member:
+        normalized["component_member_ids"] = [comp.get("id") for comp in member["component_members"]]
+    return normalized
+
+
+def normalize_members(members: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Members keyed by ID, each appearing once. Cofronts list their members
+    in component_member_ids instead of embedding copies, and tags move to
+    an ID -> labels map. "order" keeps the original list order; components
+    that aren't in the list themselves are included in "members" only.
+    """
+    by_id: Dict[str, Dict[str, Any]] = {}
+    tags: Dict[str, List[str]] = {}
+    order = []
+
+    for member in members:
+        member_id = member.get("id")
+        order.append(member_id)
+        by_id[member_id] = _normalize_member(member)
+        if "tags" in member:
+            tags[member_id] = member["tags"]
+
+    for member in members:
+        for comp in member.get("component_members") or []:
+            if comp.get("id") not in by_id:
+                by_id[comp.get("id")] = _normalize_member(comp)
+
+    return {"order": order, "members": by_id, "tags": tags}
+
+
+def normalize_fronters(fronters: Dict[str, Any]) -> Dict[str, Any]:
+    """The fronters payload with its members normalized like normalize_members"""
+    return {**fronters, **normalize_members(fronters.get("members", []))}
+
+
+def parse_fields(fields: Optional[str]) -> Optional[Tuple[str, ...]]:
+    """?fields=a,b,c as a sorted tuple that always includes id, or None for every field"""
+    if not fields:
+        return None
+    return tuple(sorted({field.strip() for field in fields.split(",") if field.strip()} | {"id"}))
+
+
+def project(member: Dict[str, Any], fields: Optional[Tuple[str, ...]]) -> Dict[str, Any]:
+    """Only the requested fields of a member"""
+    if fields is None:
+        return member
+    return {field: member[field] for field in fields if field in member}
+
+
+def _position_index(members: List[Dict[str, Any]]) -> Dict[str, int]:
+    entry = _positions.get(id(members))
+    if entry is not None and entry[0] is members:
+        return entry[1]
+
+    index = {member.get("id"): i for i, member in enumerate(members)}
+    if len(_positions) >= MAX_POSITION_INDEXES:
+        _positions.pop(next(iter(_positions)))
+    # Keep the list itself so its id() can't be reused while indexed
+    _positions[id(members)] = (members, index)
+    return index
+
+
+def paginate(
+    members: List[Dict[str, Any]],
+    cursor: Optional[str] = None,
+    limit: Optional[int] = None
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """
+    The page of members after the member ID `cursor`, and the cursor for the
+    next page (None on the last page). Raises ValueError for unknown cursors.
+    """
+    start = 0
+    if cursor:
+        position = _position_index(members).get(cursor)
+        if position is None:
+            raise ValueError(f"Unknown cursor: {cursor}")
+        start = position + 1
+
+    if limit is None:
+        return members[start:], None
+    page = members[start:start + limit]
+    next_cursor = page[-1].get("id") if page and start + limit < len(members) else None
+    return page, next_cursor
+
+
+def members_payload(members: List[Dict[str, Any]], format: str = "full", fields: Optional[Tuple[str, ...]] = None):
+    """Members in the requested format with only the requested fields"""
+    if format == "normalized":
+        payload = normalize_members(members)
+        if fields is not None:
+            payload["members"] = {member_id: project(member, fields) for member_id, member in payload["members"].items()}
+        return payload
+    if fields is None:
+        return members
+    return [project(member, fields) for member in members]
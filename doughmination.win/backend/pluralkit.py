@@ -1,18 +1,22 @@
-import httpx
+import asyncio
 import os
+from datetime import datetime, timezone
 from dotenv import load_dotenv
-from cache import get_from_cache, set_in_cache
+from cache import get_from_cache, set_in_cache, clear_cache
 from subsystems import enrich_members_with_tags, filter_members_by_subsystem
+from pluralkit_client import pk_client, PluralKitError, PRIORITY_SWITCH, PRIORITY_INTERACTIVE, PRIORITY_BACKGROUND
+from snapshots import save_snapshot, load_snapshot, mark_stale, stale_since
+from cofronts import (
+    get_dynamic_cofronts, get_registry_version, create_dynamic_cofront_definition,
+    update_dynamic_cofront_definition, delete_dynamic_cofront_definition
+)
 
 load_dotenv()
 
-BASE_URL = "https://api.pluralkit.me/v2"
-TOKEN = os.getenv("SYSTEM_TOKEN")
 CACHE_TTL = int(os.getenv("CACHE_TTL", 30))
 
-HEADERS = {
-    "Authorization": TOKEN
-}
+# How long to hold on to a stale snapshot before trying PluralKit again
+STALE_CACHE_TTL = 5
 
 # Cofront/fusion member definitions - up to 5 members
 # Values can be lists of 2-5 member names
@@ -33,16 +37,63 @@ SPECIAL_DISPLAY_NAMES = {
     "sleeping": "I am sleeping"
 }
 
+# Incremented on every switch we make, so slower reconciliation fetches
+# never overwrite a newer optimistic update
+_switch_generation = 0
+
+# Bumped whenever member data changes, so derived indexes know when to rebuild
+_members_version = 0
+_last_members_raw = None
+# Last member index built, kept past its cache TTL for optimistic switch updates
+_last_member_index = {}
+
+# Held while fetching raw member data, so concurrent cache misses share one request
+_members_raw_lock = asyncio.Lock()
+
+# Async callbacks run (as background tasks) after member data changes
+_members_listeners = []
+_listener_tasks = set()
+
+# frozenset(component member IDs) -> cofront, and the versions it was built for
+_cofront_index = {}
+_cofront_index_versions = None
+
+async def fetch_with_snapshot(snapshot_key: str, path: str, priority: int = PRIORITY_INTERACTIVE):
+    """
+    Fetch from PluralKit, falling back to the last known good snapshot when
+    PluralKit is down, timing out or rate limiting us.
+    Returns (data, stale) where stale is True when the snapshot was used.
+    """
+    try:
+        data = await pk_client.get(path, priority=priority)
+    except PluralKitError as e:
+        if e.status_code is not None and 400 <= e.status_code < 500 and e.status_code != 429:
+            # Our request was wrong, old data would only hide the problem
+            raise
+        snapshot = load_snapshot(snapshot_key)
+        if snapshot is None:
+            raise
+        print(f"Serving stale {snapshot_key} as of {snapshot['confirmed_at']}: {e}")
+        mark_stale(snapshot_key, snapshot["confirmed_at"])
+        return snapshot["data"], True
+
+    save_snapshot(snapshot_key, data)
+    return data, False
+
+def with_stale_flag(data: dict, *snapshot_keys: str) -> dict:
+    """Flag a response built from snapshot data as stale"""
+    if (saved_at := stale_since(*snapshot_keys)):
+        return {**data, "stale": True, "stale_as_of": saved_at}
+    return data
+
 async def get_system():
     cache_key = "system"
     if (cached := get_from_cache(cache_key)):
         return cached
-    async with httpx.AsyncClient() as client:
-        resp = await client.get(f"{BASE_URL}/systems/@me", headers=HEADERS)
-        resp.raise_for_status()
-        data = resp.json()
-        set_in_cache(cache_key, data, CACHE_TTL)
-        return data
+    data, stale = await fetch_with_snapshot("system", "/systems/@me")
+    data = with_stale_flag(data, "system")
+    set_in_cache(cache_key, data, STALE_CACHE_TTL if stale else CACHE_TTL)
+    return data
 
 async def get_member_by_name(members_data, name):
     """Helper function to find a member by name"""
@@ -52,6 +103,7 @@ async def get_member_by_name(members_data, name):
     return None
 
 async def get_members(subsystem_filter: str = None, include_untagged: bool = True):
+    global _last_member_index
     cache_key = f"members_{subsystem_filter}_{include_untagged}"
     if (cached := get_from_cache(cache_key)):
         return cached
@@ -59,11 +111,12 @@ async def get_members(subsystem_filter: str = None, include_untagged: bool = Tru
     # First get all members from PluralKit
     base_cache_key = "members_raw"
     if not (cached_raw := get_from_cache(base_cache_key)):
-        async with httpx.AsyncClient() as client:
-            resp = await client.get(f"{BASE_URL}/systems/@me/members", headers=HEADERS)
-            resp.raise_for_status()
-            cached_raw = resp.json()
-            set_in_cache(base_cache_key, cached_raw, CACHE_TTL)
+        async with _members_raw_lock:
+            # Another request may have fetched it while we waited
+            if not (cached_raw := get_from_cache(base_cache_key)):
+                cached_raw, stale = await fetch_with_snapshot("members_raw", "/systems/@me/members")
+                set_in_cache(base_cache_key, cached_raw, STALE_CACHE_TTL if stale else CACHE_TTL)
+                _note_members_raw(cached_raw)
     
     data = cached_raw
     
@@ -122,6 +175,12 @@ async def get_members(subsystem_filter: str = None, include_untagged: bool = Tru
         else:
             processed_members.append(member)
     
+    # Add the registered dynamic cofronts alongside the predefined ones
+    raw_index = {member.get("id"): member for member in data}
+    for definition in get_dynamic_cofronts():
+        if (cofront_member := build_dynamic_cofront(definition, raw_index)):
+            processed_members.append(cofront_member)
+    
     # Enrich all members with tag information
     processed_members = enrich_members_with_tags(processed_members)
     
@@ -133,46 +192,184 @@ async def get_members(subsystem_filter: str = None, include_untagged: bool = Tru
             include_untagged
         )
     
-    set_in_cache(cache_key, processed_members, CACHE_TTL)
+    ttl = STALE_CACHE_TTL if stale_since("members_raw") else CACHE_TTL
+    if not subsystem_filter:
+        # Index by ID so fronters and switches can resolve members without scanning
+        _last_member_index = {m.get("id"): m for m in processed_members}
+        set_in_cache("member_index", _last_member_index, ttl)
+    set_in_cache(cache_key, processed_members, ttl)
     return processed_members
 
+def _note_members_raw(members_raw):
+    """Bump the members version when PluralKit returns different member data"""
+    global _last_members_raw, _members_version
+    if members_raw != _last_members_raw:
+        _last_members_raw = members_raw
+        _members_version += 1
+        _notify_members_changed()
+
+def invalidate_members():
+    """
+    Drop cached member views, e.g. after member tags or dynamic cofronts
+    change. The raw PluralKit member list is kept, as only local data changed.
+    """
+    global _members_version
+    clear_cache("members_", keep=("members_raw",))
+    clear_cache("member_index")
+    clear_cache("fronters")
+    _members_version += 1
+    _notify_members_changed()
+
+def add_members_listener(callback):
+    """Register an async callback invoked after member data changes"""
+    _members_listeners.append(callback)
+
+def _notify_members_changed():
+    for callback in _members_listeners:
+        try:
+            task = asyncio.get_running_loop().create_task(callback())
+        except RuntimeError:
+            # No event loop, e.g. called from a script
+            continue
+        _listener_tasks.add(task)
+        task.add_done_callback(_listener_tasks.discard)
+
+def get_members_version() -> int:
+    return _members_version
+
+async def get_member_index():
+    """Get processed members keyed by member ID"""
+    if (cached := get_from_cache("member_index")):
+        return cached
+    all_members = await get_members()
+    return {m.get("id"): m for m in all_members}
+
+def _cofront_summary(cofront: dict) -> dict:
+    """Cofront details without the component member copies"""
+    return {key: value for key, value in cofront.items() if key != "component_members"}
+
+async def get_cofront_index():
+    """
+    Get the frozenset(component member IDs) -> cofront index covering both
+    COFRONTS and dynamic cofronts. Only rebuilt when members or cofront
+    definitions change.
+    """
+    global _cofront_index, _cofront_index_versions
+    member_index = await get_member_index()
+    
+    versions = (_members_version, get_registry_version())
+    if versions == _cofront_index_versions:
+        return _cofront_index
+    
+    index = {}
+    for member in member_index.values():
+        if member.get("is_cofront") and member.get("component_members"):
+            key = frozenset(comp.get("id") for comp in member["component_members"])
+            # Predefined cofronts win over dynamic ones for the same set of members
+            if key not in index or not member.get("is_dynamic"):
+                index[key] = _cofront_summary(member)
+    
+    _cofront_index = index
+    _cofront_index_versions = versions
+    return index
+
+def build_fronters_payload(switch: dict, member_index: dict, cofront_index: dict = None) -> dict:
+    """
+    Build the fronters response from a switch object, whose members may be
+    member objects or plain member IDs. If the fronting set matches a cofront
+    it is added as "cofront".
+    """
+    data = {**switch}
+    
+    # Process special members and cofronts in fronters
+    if "members" in data:
+        processed_fronters = []
+        for member in data["members"]:
+            if isinstance(member, str):
+                member = {"id": member}
+            
+            # Use the processed member data (which includes cofront, special display name, and tag handling)
+            processed_member = member_index.get(member.get("id"))
+            if processed_member:
+                processed_fronters.append(processed_member)
+            else:
+                # Fallback to original member data but still enrich with tags
+                enriched_member = enrich_members_with_tags([member])[0]
+                processed_fronters.append(enriched_member)
+        
+        data["members"] = processed_fronters
+        
+        # Recognise cofronts whose members fronted individually
+        if cofront_index and len(processed_fronters) > 1:
+            fronting_set = frozenset(m.get("id") for m in processed_fronters)
+            if (cofront := cofront_index.get(fronting_set)):
+                data["cofront"] = cofront
+    
+    return data
+
 async def get_fronters():
     cache_key = "fronters"
     if (cached := get_from_cache(cache_key)):
         return cached
-    async with httpx.AsyncClient() as client:
-        resp = await client.get(f"{BASE_URL}/systems/@me/fronters", headers=HEADERS)
-        resp.raise_for_status()
-        data = resp.json()
-        
-        # Process special members and cofronts in fronters
-        if "members" in data:
-            # Get all members for reference (without filtering)
-            all_members = await get_members()
-            
-            processed_fronters = []
-            for member in data["members"]:
-                member_name = member.get("name")
-                
-                # Find the processed member data from our get_members function
-                processed_member = None
-                for m in all_members:
-                    if m.get("id") == member.get("id"):
-                        processed_member = m
-                        break
-                
-                if processed_member:
-                    # Use the processed member data (which includes cofront, special display name, and tag handling)
-                    processed_fronters.append(processed_member)
-                else:
-                    # Fallback to original member data but still enrich with tags
-                    enriched_member = enrich_members_with_tags([member])[0]
-                    processed_fronters.append(enriched_member)
-            
-            data["members"] = processed_fronters
-        
-        set_in_cache(cache_key, data, CACHE_TTL)
-        return data
+    raw_data, _ = await fetch_with_snapshot("fronters_raw", "/systems/@me/fronters")
+    
+    # Get all members for reference (without filtering)
+    if "members" in raw_data:
+        member_index = await get_member_index()
+        cofront_index = await get_cofront_index()
+    else:
+        member_index, cofront_index = {}, {}
+    data = build_fronters_payload(raw_data, member_index, cofront_index)
+    
+    data = with_stale_flag(data, "fronters_raw", "members_raw")
+    set_in_cache(cache_key, data, STALE_CACHE_TTL if "stale" in data else CACHE_TTL)
+    return data
+
+async def apply_switch(member_ids, switch=None):
+    """
+    Optimistically update the cached fronters after a successful switch,
+    using the switch response and the last known member and cofront indexes
+    instead of refetching. Reconciliation corrects anything out of date.
+    """
+    global _switch_generation
+    _switch_generation += 1
+    
+    if not switch or "members" not in switch:
+        switch = {
+            **(switch or {}),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "members": list(member_ids)
+        }
+    
+    # Never fetch members here, that would cost the switch a second upstream request
+    member_index = get_from_cache("member_index") or _last_member_index
+    data = build_fronters_payload(switch, member_index, _cofront_index)
+    set_in_cache("fronters", data, CACHE_TTL)
+    return data
+
+def _fronter_ids(data) -> list:
+    return [m.get("id") if isinstance(m, dict) else m for m in (data or {}).get("members", [])]
+
+async def reconcile_fronters():
+    """
+    Confirm the cached fronters against PluralKit.
+    Returns the fresh fronters if they differ from what we had, otherwise None.
+    """
+    generation = _switch_generation
+    previous = get_from_cache("fronters")
+    
+    fresh, stale = await fetch_with_snapshot("fronters_raw", "/systems/@me/fronters", PRIORITY_BACKGROUND)
+    if stale or not fresh or generation != _switch_generation:
+        # Nothing trustworthy to compare against, or another switch happened
+        # while we were fetching and that one wins
+        return None
+    
+    data = build_fronters_payload(fresh, await get_member_index(), await get_cofront_index())
+    set_in_cache("fronters", data, CACHE_TTL)
+    
+    if previous is not None and _fronter_ids(previous) == _fronter_ids(data):
+        return None
+    return data
 
 async def set_front(member_ids):
     """
@@ -187,69 +384,105 @@ async def set_front(member_ids):
     cache_key = "fronters"
     set_in_cache(cache_key, None, 0)  # Invalidate cache
     
-    async with httpx.AsyncClient() as client:
-        resp = await client.post(
-            f"{BASE_URL}/systems/@me/switches",
-            headers=HEADERS,
-            json={"members": member_ids}
+    try:
+        # Switches jump ahead of background refreshes in the request queue
+        return await pk_client.post(
+            "/systems/@me/switches",
+            json={"members": member_ids},
+            priority=PRIORITY_SWITCH
         )
-        if resp.status_code not in (200, 204):
-            raise Exception(f"Failed to set front: {resp.status_code} - {resp.text}")
-
-        # If there's a response body, return it, otherwise return None
-        return resp.json() if resp.content else None
+    except PluralKitError as e:
+        if e.status_code is None or e.status_code == 429:
+            raise
+        raise PluralKitError(f"Failed to set front: {e}", status_code=e.status_code)
 
-async def create_dynamic_cofront(member_ids, name=None):
-    """
-    Create a dynamic cofront from a list of member IDs.
-    If name is not provided, a name will be generated based on the first letter of each member.
+def build_dynamic_cofront(definition: dict, member_index: dict):
+    """Resolve a dynamic cofront definition into cofront member data"""
+    component_members = [
+        member_index[member_id]
+        for member_id in definition["member_ids"]
+        if member_id in member_index
+    ]
+    if not component_members:
+        return None
     
-    This is a helper function and doesn't directly interact with PluralKit API.
-    The frontend would need additional routes to use this functionality.
-    """
+    # Combine display names - FIX: Handle None values
+    display_names = []
+    for comp in component_members:
+        display_name = comp.get("display_name") or comp.get("name") or "Unknown"
+        display_names.append(display_name)
+    
+    # Create cofront data structure
+    return {
+        "id": definition["id"],
+        "name": definition["name"],
+        "is_cofront": True,
+        "component_members": component_members,
+        "display_name": " + ".join(display_names),
+        "original_name": definition["name"],
+        "component_avatars": [comp.get("avatar_url") for comp in component_members if comp.get("avatar_url")],
+        "member_count": len(component_members),
+        "is_dynamic": True,  # Flag to indicate this is a dynamically created cofront
+        "created_at": definition.get("created_at")
+    }
+
+async def _validate_cofront_members(member_ids) -> dict:
+    """Check the member count and that every member exists, returning the member index"""
     if len(member_ids) < 2 or len(member_ids) > MAX_FRONTERS:
         raise ValueError(f"Cofronts must have between 2 and {MAX_FRONTERS} members")
     
     # Get all members for reference (without filtering)
-    all_members = await get_members()
-    
-    # Find the members by their IDs
-    component_members = []
-    for member_id in member_ids:
-        for member in all_members:
-            if member.get("id") == member_id:
-                component_members.append(member)
-                break
+    member_index = await get_member_index()
     
     # Verify we found all members
-    if len(component_members) != len(member_ids):
+    if any(member_id not in member_index for member_id in member_ids):
         raise ValueError("One or more member IDs not found")
     
+    return member_index
+
+async def _resolve_dynamic_cofront(definition: dict) -> dict:
+    """Drop cached member views so they pick up registry changes, then resolve the cofront"""
+    invalidate_members()
+    member_index = await get_member_index()
+    return member_index.get(definition["id"]) or build_dynamic_cofront(definition, member_index)
+
+async def create_dynamic_cofront(member_ids, name=None):
+    """
+    Create a dynamic cofront from a list of member IDs.
+    If name is not provided, a name will be generated based on the first letter of each member.
+    
+    The cofront is stored in the dynamic cofront registry, so it shows up in the
+    member list and is recognised when its members front together. Creating a
+    cofront for a set of members that already has one raises DynamicCofrontExistsError.
+    """
+    member_index = await _validate_cofront_members(member_ids)
+    
     # Generate a name if not provided - FIX: Handle None values
     if not name:
         # Use first letter of each member name, but handle None/empty names
         name_parts = []
-        for member in component_members:
-            member_name = member.get("name") or "Unknown"
+        for member_id in member_ids:
+            member_name = member_index[member_id].get("name") or "Unknown"
             if member_name:
                 name_parts.append(member_name[0])
         name = "".join(name_parts) or "Cofront"
     
-    # Combine display names - FIX: Handle None values
-    display_names = []
-    for comp in component_members:
-        display_name = comp.get("display_name") or comp.get("name") or "Unknown"
-        display_names.append(display_name)
-    
-    # Create cofront data structure
-    cofront_data = {
-        "is_cofront": True,
-        "component_members": component_members,
-        "display_name": " + ".join(display_names),
-        "original_name": name,
-        "component_avatars": [comp.get("avatar_url") for comp in component_members if comp.get("avatar_url")],
-        "member_count": len(component_members),
-        "is_dynamic": True  # Flag to indicate this is a dynamically created cofront
-    }
+    definition = create_dynamic_cofront_definition(member_ids, name)
+    return await _resolve_dynamic_cofront(definition)
+
+async def update_dynamic_cofront(cofront_id, name=None, member_ids=None):
+    """Rename a dynamic cofront or change its members. Returns None if it doesn't exist."""
+    if member_ids is not None:
+        await _validate_cofront_members(member_ids)
     
-    return cofront_data
\ No newline at end of file
+    definition = update_dynamic_cofront_definition(cofront_id, name, member_ids)
+    if not definition:
+        return None
+    return await _resolve_dynamic_cofront(definition)
+
+def delete_dynamic_cofront(cofront_id) -> bool:
+    """Remove a dynamic cofront from the registry"""
+    deleted = delete_dynamic_cofront_definition(cofront_id)
+    if deleted:
+        invalidate_members()
+    return deleted
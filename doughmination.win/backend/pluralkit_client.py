@@ -0,0 +1,469 @@
+import asyncio
+import heapq
+import itertools
+import os
+import random
+import time
+from email.utils import parsedate_to_datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import httpx
+from dotenv import load_dotenv
+
+load_dotenv()
+
+BASE_URL = "https://api.pluralkit.me/v2"
+TOKEN = os.getenv("SYSTEM_TOKEN")
+
+HEADERS = {
+    "Authorization": TOKEN
+}
+
+# PluralKit's published limits: 10/s for GET requests, 3/s for POST/PATCH/DELETE
+READ_RATE_LIMIT = float(os.getenv("PK_READ_RATE_LIMIT", 10))
+WRITE_RATE_LIMIT = float(os.getenv("PK_WRITE_RATE_LIMIT", 3))
+
+# Retry behaviour for idempotent requests
+MAX_RETRIES = int(os.getenv("PK_MAX_RETRIES", 3))
+BACKOFF_BASE = 0.5  # seconds
+BACKOFF_CAP = 8.0  # seconds
+
+# Longest a request may wait for a rate limit slot before giving up
+MAX_QUEUE_WAIT = float(os.getenv("PK_MAX_QUEUE_WAIT", 10))
+
+# Per-request timeout in seconds
+REQUEST_TIMEOUT = float(os.getenv("PK_TIMEOUT", 5))
+
+# Circuit breaker: open after this many consecutive failures, probe again after the cooldown
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("PK_BREAKER_FAILURES", 5))
+BREAKER_RESET_TIMEOUT = float(os.getenv("PK_BREAKER_RESET", 30))
+
+# Request priorities (lower runs first)
+PRIORITY_SWITCH = 0  # User-initiated switches
+PRIORITY_INTERACTIVE = 1  # Reads serving a user request
+PRIORITY_BACKGROUND = 2  # Background refreshes and history sync
+
+PRIORITY_LABELS = {
+    PRIORITY_SWITCH: "switch",
+    PRIORITY_INTERACTIVE: "interactive",
+    PRIORITY_BACKGROUND: "background",
+}
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class PluralKitError(Exception):
+    """Raised when a PluralKit request fails"""
+    def __init__(self, message: str, status_code: Optional[int] = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class PluralKitRateLimitError(PluralKitError):
+    """Raised when the request budget is exhausted and waiting would take too long"""
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message, status_code=429)
+        self.retry_after = retry_after
+
+
+class PluralKitUnavailableError(PluralKitError):
+    """Raised without contacting PluralKit while the circuit breaker is open"""
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message, status_code=503)
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    Stops calling PluralKit after repeated failures.
+
+    closed -> open after `failure_threshold` consecutive failures. While open
+    every request fails fast. After `reset_timeout` one probe request is let
+    through (half-open); its outcome closes or re-opens the breaker.
+    """
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0  # monotonic
+        self.degraded_since: Optional[float] = None  # wall clock, for reporting
+        self.probe_in_flight = False
+        self._listeners: List[Callable[[str], Awaitable[None]]] = []
+        self._tasks = set()
+
+    def add_listener(self, callback: Callable[[str], Awaitable[None]]):
+        """Register an async callback invoked with the new state on every transition"""
+        self._listeners.append(callback)
+
+    def _transition(self, state: str):
+        if state == self.state:
+            return
+        print(f"PluralKit circuit breaker: {self.state} -> {state}")
+        self.state = state
+        if state == self.OPEN and self.degraded_since is None:
+            self.degraded_since = time.time()
+        elif state == self.CLOSED:
+            self.degraded_since = None
+        for callback in self._listeners:
+            task = asyncio.create_task(callback(state))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    def retry_after(self) -> float:
+        return max(self.opened_at + self.reset_timeout - time.monotonic(), 1.0)
+
+    def before_request(self) -> bool:
+        """
+        Raise PluralKitUnavailableError if the request should not be attempted.
+        Returns True when the request is the half-open probe.
+        """
+        if self.state == self.CLOSED:
+            return False
+        if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self._transition(self.HALF_OPEN)
+        if self.state == self.HALF_OPEN and not self.probe_in_flight:
+            self.probe_in_flight = True
+            return True
+        raise PluralKitUnavailableError(
+            "PluralKit is currently unavailable",
+            retry_after=self.retry_after()
+        )
+
+    def record_success(self):
+        self.failures = 0
+        self.probe_in_flight = False
+        self._transition(self.CLOSED)
+
+    def record_failure(self):
+        self.failures += 1
+        was_probe = self.probe_in_flight
+        self.probe_in_flight = False
+        if was_probe or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+            self._transition(self.OPEN)
+
+    def record_neutral(self):
+        """The request got an answer that says nothing about PluralKit's health"""
+        if self.probe_in_flight:
+            self.record_success()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.failures,
+            "degraded_since": self.degraded_since,
+            "retry_in_seconds": round(self.retry_after(), 2) if self.state != self.CLOSED else 0,
+        }
+
+
+class TokenBucket:
+    """Client-side token bucket refilling at `rate` tokens per second"""
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self) -> float:
+        """Seconds until a token is available"""
+        self._refill()
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def consume(self):
+        self._refill()
+        self.tokens -= 1
+
+    def limit_to(self, remaining: int):
+        """Never believe we have more tokens than the server says we do"""
+        self._refill()
+        self.tokens = min(self.tokens, remaining)
+
+
+class _Scope:
+    """A rate limit scope with its own bucket and priority queue of waiters"""
+    def __init__(self, name: str, rate: float):
+        self.name = name
+        self.bucket = TokenBucket(rate)
+        self.waiters: List[tuple] = []  # heap of (priority, seq, future)
+        self.blocked_until = 0.0  # monotonic time set from server headers
+        self.dispatcher: Optional[asyncio.Task] = None
+
+    def delay(self) -> float:
+        return max(self.bucket.delay(), self.blocked_until - time.monotonic(), 0.0)
+
+
+class PluralKitClient:
+    """
+    Rate-limit-aware PluralKit API client.
+
+    All requests share one HTTP connection pool and wait for a token from the
+    bucket of their rate limit scope. Waiters are served in priority order, so
+    switches go ahead of background refreshes when the budget is tight.
+    Outages trip a circuit breaker so callers fail fast instead of waiting
+    on timeouts.
+    """
+    def __init__(self):
+        self._client: Optional[httpx.AsyncClient] = None
+        self.breaker = CircuitBreaker(BREAKER_FAILURE_THRESHOLD, BREAKER_RESET_TIMEOUT)
+        self._scopes = {
+            "read": _Scope("read", READ_RATE_LIMIT),
+            "write": _Scope("write", WRITE_RATE_LIMIT),
+        }
+        self._seq = itertools.count()
+        self._counters = {
+            "requests": 0,
+            "retries": 0,
+            "rate_limited": 0,
+            "failures": 0,
+        }
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                base_url=BASE_URL,
+                headers=HEADERS,
+                timeout=REQUEST_TIMEOUT
+            )
+        return self._client
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    # ------------------------------------------------------------------
+    # Request budget
+    # ------------------------------------------------------------------
+
+    async def _acquire(self, scope: _Scope, priority: int):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        heapq.heappush(scope.waiters, (priority, next(self._seq), future))
+        if scope.dispatcher is None or scope.dispatcher.done():
+            scope.dispatcher = asyncio.create_task(self._dispatch(scope))
+
+        try:
+            await asyncio.wait_for(future, timeout=MAX_QUEUE_WAIT)
+        except asyncio.TimeoutError:
+            raise PluralKitRateLimitError(
+                "PluralKit request budget exhausted, try again shortly",
+                retry_after=max(scope.delay(), 1.0)
+            )
+
+    async def _dispatch(self, scope: _Scope):
+        """Hand out tokens to waiters, highest priority first"""
+        while scope.waiters:
+            _, _, future = scope.waiters[0]
+            if future.done():
+                # Timed out or cancelled while queued
+                heapq.heappop(scope.waiters)
+                continue
+
+            delay = scope.delay()
+            if delay > 0:
+                # Re-check the head afterwards, a higher priority waiter may have arrived
+                await asyncio.sleep(delay)
+                continue
+
+            heapq.heappop(scope.waiters)
+            scope.bucket.consume()
+            future.set_result(None)
+
+    def _update_from_headers(self, scope: _Scope, response: httpx.Response):
+        """Sync the local budget with PluralKit's rate limit headers"""
+        remaining = response.headers.get("X-RateLimit-Remaining")
+        reset = response.headers.get("X-RateLimit-Reset")
+        if remaining is None:
+            return
+
+        try:
+            remaining = int(remaining)
+        except ValueError:
+            return
+
+        scope.bucket.limit_to(remaining)
+        if remaining <= 0 and reset:
+            try:
+                reset_at = float(reset)
+            except ValueError:
+                return
+            # PluralKit reports the reset as a unix timestamp in milliseconds
+            if reset_at > 1e11:
+                reset_at /= 1000
+            wait = reset_at - time.time()
+            if wait > 0:
+                scope.blocked_until = max(scope.blocked_until, time.monotonic() + wait)
+
+    # ------------------------------------------------------------------
+    # Requests
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _retry_after(response: httpx.Response) -> Optional[float]:
+        value = response.headers.get("Retry-After")
+        if not value:
+            return None
+        try:
+            return max(float(value), 0.0)
+        except ValueError:
+            pass
+        try:
+            return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+        except (TypeError, ValueError):
+            return None
+
+    @staticmethod
+    def _backoff(attempt: int) -> float:
+        """Exponential backoff with full jitter"""
+        return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * (2 ** attempt)))
+
+    async def request(
+        self,
+        method: str,
+        path: str,
+        *,
+        priority: Optional[int] = None,
+        params: Optional[Dict[str, Any]] = None,
+        json: Any = None
+    ) -> Any:
+        """
+        Perform a PluralKit API request and return the decoded JSON body
+        (or None for empty responses).
+
+        GET requests are retried with jittered exponential backoff on
+        429/5xx responses and network errors. Other methods are only retried
+        on 429, since PluralKit rejected them without applying them.
+        """
+        method = method.upper()
+        idempotent = method == "GET"
+        scope = self._scopes["read" if idempotent else "write"]
+        if priority is None:
+            priority = PRIORITY_INTERACTIVE if idempotent else PRIORITY_SWITCH
+
+        is_probe = self.breaker.before_request()
+        try:
+            result = await self._request_with_retries(method, path, scope, priority, idempotent, params, json)
+        except PluralKitError as e:
+            if e.status_code is None or e.status_code >= 500:
+                # Network errors, timeouts and server errors mean PluralKit is unhealthy
+                self.breaker.record_failure()
+            else:
+                self.breaker.record_neutral()
+            raise
+        except BaseException:
+            if is_probe:
+                # Cancelled mid-probe, let the next request probe instead
+                self.breaker.probe_in_flight = False
+            raise
+        self.breaker.record_success()
+        return result
+
+    async def _request_with_retries(
+        self,
+        method: str,
+        path: str,
+        scope: _Scope,
+        priority: int,
+        idempotent: bool,
+        params: Optional[Dict[str, Any]],
+        json: Any
+    ) -> Any:
+        attempt = 0
+        while True:
+            await self._acquire(scope, priority)
+            self._counters["requests"] += 1
+
+            try:
+                response = await self._get_client().request(method, path, params=params, json=json)
+            except httpx.TransportError as e:
+                if idempotent and attempt < MAX_RETRIES:
+                    delay = self._backoff(attempt)
+                    print(f"PluralKit {method} {path} failed ({e!r}), retrying in {delay:.2f}s")
+                    self._counters["retries"] += 1
+                    attempt += 1
+                    await asyncio.sleep(delay)
+                    continue
+                self._counters["failures"] += 1
+                raise PluralKitError(f"PluralKit request failed: {e!r}")
+
+            self._update_from_headers(scope, response)
+
+            if response.status_code < 400:
+                return response.json() if response.content else None
+
+            retry_after = self._retry_after(response)
+            if response.status_code == 429:
+                self._counters["rate_limited"] += 1
+                if retry_after is not None:
+                    scope.blocked_until = max(scope.blocked_until, time.monotonic() + retry_after)
+
+            retryable = response.status_code == 429 or (idempotent and response.status_code in RETRYABLE_STATUS_CODES)
+            if retryable and attempt < MAX_RETRIES:
+                delay = max(retry_after or 0.0, self._backoff(attempt))
+                if delay <= MAX_QUEUE_WAIT:
+                    print(f"PluralKit {method} {path} returned {response.status_code}, retrying in {delay:.2f}s")
+                    self._counters["retries"] += 1
+                    attempt += 1
+                    await asyncio.sleep(delay)
+                    continue
+
+            self._counters["failures"] += 1
+            if response.status_code == 429:
+                raise PluralKitRateLimitError(
+                    "PluralKit rate limit reached, try again shortly",
+                    retry_after=max(retry_after or scope.delay(), 1.0)
+                )
+            raise PluralKitError(
+                f"PluralKit {method} {path} failed: {response.status_code} - {response.text}",
+                status_code=response.status_code
+            )
+
+    async def get(self, path: str, *, priority: int = PRIORITY_INTERACTIVE, params: Optional[Dict[str, Any]] = None) -> Any:
+        return await self.request("GET", path, priority=priority, params=params)
+
+    async def post(self, path: str, *, json: Any = None, priority: int = PRIORITY_SWITCH) -> Any:
+        return await self.request("POST", path, priority=priority, json=json)
+
+    # ------------------------------------------------------------------
+    # Stats
+    # ------------------------------------------------------------------
+
+    def stats(self) -> Dict[str, Any]:
+        """Current request budget and queue depth for each rate limit scope"""
+        scopes = {}
+        for name, scope in self._scopes.items():
+            queued = {label: 0 for label in PRIORITY_LABELS.values()}
+            for priority, _, future in scope.waiters:
+                if not future.done():
+                    queued[PRIORITY_LABELS.get(priority, "background")] += 1
+            delay = scope.delay()
+            scopes[name] = {
+                "rate_per_second": scope.bucket.rate,
+                "capacity": scope.bucket.capacity,
+                "tokens_available": round(scope.bucket.tokens, 2),
+                "blocked_for_seconds": round(max(scope.blocked_until - time.monotonic(), 0.0), 2),
+                "next_slot_in_seconds": round(delay, 2),
+                "queued": queued,
+                "queue_length": sum(queued.values()),
+            }
+        return {
+            "scopes": scopes,
+            "counters": dict(self._counters),
+            "circuit_breaker": self.breaker.stats(),
+        }
+
+
+# Shared client instance used by all PluralKit calls
+pk_client = PluralKitClient()
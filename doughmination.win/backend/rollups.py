@@ -0,0 +1,126 @@
+from bisect import bisect_right
+from typing import Dict, Optional, Tuple
+from timeline import SwitchTimeline, get_timeline
+
+US_PER_HOUR = 3600 * 1_000_000
+US_PER_DAY = 24 * US_PER_HOUR
+
+
+class FrontingRollups:
+    """
+    Per-member fronting time in hourly and daily UTC buckets.
+
+    Only closed intervals (switch to next switch) are rolled up, all in
+    integer microseconds so sums don't depend on the order they were added.
+    The still-open interval after the latest switch is added at query time.
+    """
+    def __init__(self):
+        self.hourly: Dict[int, Dict[str, int]] = {}  # hour number -> member id -> microseconds
+        self.daily: Dict[int, Dict[str, int]] = {}  # day number -> member id -> microseconds
+        self.timeline: Optional[SwitchTimeline] = None
+        self.count = 0  # switches in the timeline last rolled up
+
+    def update(self, timeline: SwitchTimeline):
+        """Roll up intervals closed since the last update, or rebuild if history changed"""
+        if timeline is self.timeline:
+            return
+
+        start = self.count - 1
+        appended = (
+            self.timeline is not None
+            and self.count > 0
+            and timeline.rewrites == self.timeline.rewrites
+            and len(timeline) >= self.count
+            and timeline.switch_ids[start] == self.timeline.switch_ids[start]
+        )
+        if not appended:
+            # Switches were edited, deleted or backfilled, start over
+            self.hourly, self.daily = {}, {}
+            start = 0
+
+        timestamps = timeline.timestamps
+        for i in range(max(start, 0), len(timeline) - 1):
+            member_ids = timeline.member_id_list(i)
+            if member_ids:
+                self._add(self.hourly, US_PER_HOUR, timestamps[i], timestamps[i + 1], member_ids)
+                self._add(self.daily, US_PER_DAY, timestamps[i], timestamps[i + 1], member_ids)
+
+        self.timeline = timeline
+        self.count = len(timeline)
+
+    @staticmethod
+    def _add(buckets: Dict[int, Dict[str, int]], size: int, start: int, end: int, member_ids):
+        bucket = start // size
+        while start < end:
+            bucket_end = min((bucket + 1) * size, end)
+            totals = buckets.setdefault(bucket, {})
+            for member_id in member_ids:
+                totals[member_id] = totals.get(member_id, 0) + bucket_end - start
+            start = bucket_end
+            bucket += 1
+
+    @staticmethod
+    def _sum(buckets: Dict[int, Dict[str, int]], first: int, last: int, totals: Dict[str, int]):
+        for bucket in range(first, last):
+            for member_id, us in buckets.get(bucket, {}).items():
+                totals[member_id] = totals.get(member_id, 0) + us
+
+    def _walk(self, start: int, end: int, now_us: int, totals: Dict[str, int]):
+        """Exact fronting time in [start, end) from the raw timeline, for partial buckets"""
+        timeline = self.timeline
+        timestamps = timeline.timestamps
+        i = max(bisect_right(timestamps, start) - 1, 0)
+        while i < len(timestamps) and timestamps[i] < end:
+            interval_end = timestamps[i + 1] if i + 1 < len(timestamps) else now_us
+            overlap = min(interval_end, end) - max(timestamps[i], start)
+            if overlap > 0:
+                for member_id in timeline.member_id_list(i):
+                    totals[member_id] = totals.get(member_id, 0) + overlap
+            i += 1
+
+    def fronting_us(self, start: int, end: int, now_us: int) -> Tuple[int, Dict[str, int]]:
+        """
+        Fronting time per member between start and end (epoch microseconds).
+        Returns (microseconds of tracked time in the range, {member id: microseconds}).
+        """
+        totals: Dict[str, int] = {}
+        if self.timeline is None or not len(self.timeline):
+            return 0, totals
+
+        timestamps = self.timeline.timestamps
+        start = max(start, timestamps[0])
+        end = min(end, now_us)
+        if start >= end:
+            return 0, totals
+
+        # Whole buckets only cover closed intervals, i.e. up to the latest switch
+        closed_end = min(end, timestamps[-1])
+        first_hour = -(-start // US_PER_HOUR)
+        last_hour = closed_end // US_PER_HOUR
+
+        if first_hour >= last_hour:
+            self._walk(start, end, now_us, totals)
+            return end - start, totals
+
+        self._walk(start, first_hour * US_PER_HOUR, now_us, totals)
+
+        first_day = -(-first_hour // 24)
+        last_day = last_hour // 24
+        if first_day < last_day:
+            self._sum(self.hourly, first_hour, first_day * 24, totals)
+            self._sum(self.daily, first_day, last_day, totals)
+            self._sum(self.hourly, last_day * 24, last_hour, totals)
+        else:
+            self._sum(self.hourly, first_hour, last_hour, totals)
+
+        self._walk(last_hour * US_PER_HOUR, end, now_us, totals)
+        return end - start, totals
+
+
+_rollups = FrontingRollups()
+
+
+async def get_rollups() -> FrontingRollups:
+    """Get the shared rollups, brought up to date with the switch timeline"""
+    _rollups.update(await get_timeline())
+    return _rollups
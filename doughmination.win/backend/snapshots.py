@@ -0,0 +1,113 @@
+import json
+import os
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+# Define data directory
+DATA_DIR = Path("dough-data")
+SNAPSHOT_DIR = DATA_DIR / "snapshots"
+
+# Ensure snapshot directory exists
+SNAPSHOT_DIR.mkdir(parents=True, exist_ok=True)
+
+# Last known good PluralKit responses, keyed by snapshot name
+_snapshots: Dict[str, Dict[str, Any]] = {}
+
+# Snapshots currently being served in place of live data: key -> confirmed_at
+_stale: Dict[str, str] = {}
+
+
+def _snapshot_path(key: str) -> Path:
+    return SNAPSHOT_DIR / f"{key}.json"
+
+
+def _confirmed_path(key: str) -> Path:
+    return SNAPSHOT_DIR / f"{key}.confirmed"
+
+
+def _write_atomic(path: Path, text: str):
+    # Write atomically so a crash never leaves a truncated file behind
+    tmp_path = path.with_suffix(path.suffix + ".tmp")
+    with open(tmp_path, "w") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+def save_snapshot(key: str, data: Any):
+    """
+    Remember a successful PluralKit response. The data is only rewritten
+    when it changed; otherwise just its confirmed_at time moves forward.
+    """
+    _stale.pop(key, None)
+    now = datetime.now(timezone.utc).isoformat()
+
+    current = load_snapshot(key)
+    if current is not None and current["data"] == data:
+        current["confirmed_at"] = now
+        try:
+            _write_atomic(_confirmed_path(key), now)
+        except Exception as e:
+            print(f"Error saving snapshot {key}: {e}")
+        return
+
+    snapshot = {
+        "data": data,
+        "saved_at": now,
+        "confirmed_at": now
+    }
+    _snapshots[key] = snapshot
+
+    try:
+        _write_atomic(_snapshot_path(key), json.dumps(snapshot))
+    except Exception as e:
+        print(f"Error saving snapshot {key}: {e}")
+
+
+def load_snapshot(key: str) -> Optional[Dict[str, Any]]:
+    """
+    Get the last known good snapshot for a key: {"data", "saved_at" (when the
+    data last changed), "confirmed_at" (when PluralKit last returned it)}
+    """
+    if key in _snapshots:
+        return _snapshots[key]
+
+    path = _snapshot_path(key)
+    if not os.path.exists(path):
+        return None
+
+    try:
+        with open(path, "r") as f:
+            snapshot = json.load(f)
+    except Exception as e:
+        print(f"Error loading snapshot {key}: {e}")
+        return None
+
+    # Snapshots written before confirmed_at existed only have saved_at
+    confirmed_at = snapshot.get("confirmed_at", snapshot["saved_at"])
+    try:
+        confirmed_at = max(confirmed_at, _confirmed_path(key).read_text().strip())
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        print(f"Error loading snapshot {key}: {e}")
+    snapshot["confirmed_at"] = confirmed_at
+
+    _snapshots[key] = snapshot
+    return snapshot
+
+
+def mark_stale(key: str, stale_as_of: str):
+    """Record that a snapshot is being served instead of live data, up to date as of stale_as_of"""
+    _stale[key] = stale_as_of
+
+
+def clear_stale(key: str):
+    """Record that live data is being served for a key again"""
+    _stale.pop(key, None)
+
+
+def stale_since(*keys: str) -> Optional[str]:
+    """Oldest stale-as-of time among the given keys currently served stale, or None"""
+    stale = [_stale[key] for key in keys if key in _stale]
+    return min(stale) if stale else None
@@ -0,0 +1,109 @@
+import asyncio
+import os
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from dotenv import load_dotenv
+from cache import get_from_cache
+from pluralkit import set_front, apply_switch, MAX_FRONTERS
+
+load_dotenv()
+
+# Seconds to collect switch requests before applying the latest one (0 applies immediately)
+SWITCH_COALESCE_WINDOW = float(os.getenv("SWITCH_COALESCE_WINDOW", 0))
+
+
+class SwitchQueue:
+    """
+    Queue in front of set_front that collapses rapid switch requests.
+
+    Requests arriving within `window` seconds of the first one are merged and
+    only the last requested fronters are sent to PluralKit. If they match the
+    current fronters no switch is written at all. Every waiting request gets
+    the same final result:
+
+        {"switch": ..., "fronters": ..., "switched": bool, "coalesced": int}
+    """
+    def __init__(
+        self,
+        window: float = SWITCH_COALESCE_WINDOW,
+        on_applied: Optional[Callable[[Dict[str, Any]], Awaitable[None]]] = None
+    ):
+        self.window = window
+        self.on_applied = on_applied
+        self._pending_ids: Optional[List[str]] = None
+        self._waiters: List[asyncio.Future] = []
+        self._flush_task: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+        self.stats = {
+            "requests": 0,
+            "switches_written": 0,
+            "skipped_unchanged": 0,
+        }
+
+    async def submit(self, member_ids: List[str]) -> Dict[str, Any]:
+        """Request a switch and wait for the batch it ends up in to be applied"""
+        # Validate here so a bad request fails on its own instead of with its batch
+        if len(member_ids) > MAX_FRONTERS:
+            raise ValueError(f"Cannot have more than {MAX_FRONTERS} members fronting at once")
+
+        self.stats["requests"] += 1
+        future = asyncio.get_running_loop().create_future()
+        self._pending_ids = list(member_ids)
+        self._waiters.append(future)
+
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush())
+
+        return await future
+
+    async def _flush(self):
+        if self.window > 0:
+            await asyncio.sleep(self.window)
+
+        # One switch at a time; requests arriving meanwhile join this batch
+        async with self._lock:
+            member_ids, waiters = self._pending_ids, self._waiters
+            self._pending_ids, self._waiters, self._flush_task = None, [], None
+
+            try:
+                result = await self._apply(member_ids, len(waiters))
+            except Exception as e:
+                for waiter in waiters:
+                    if not waiter.done():
+                        waiter.set_exception(e)
+                return
+
+            for waiter in waiters:
+                if not waiter.done():
+                    waiter.set_result(result)
+
+    async def _apply(self, member_ids: List[str], coalesced: int) -> Dict[str, Any]:
+        current = get_from_cache("fronters")
+        if current and not current.get("stale"):
+            # Order matters: the first member is the primary fronter
+            current_ids = [m.get("id") for m in current.get("members", [])]
+            if current_ids == list(member_ids):
+                self.stats["skipped_unchanged"] += 1
+                return {
+                    "switch": None,
+                    "fronters": current,
+                    "switched": False,
+                    "coalesced": coalesced
+                }
+
+        switch = await set_front(member_ids)
+        fronters_data = await apply_switch(member_ids, switch)
+        self.stats["switches_written"] += 1
+
+        if self.on_applied is not None:
+            try:
+                await self.on_applied(fronters_data)
+            except Exception as e:
+                # The switch itself succeeded, don't fail the requests over it
+                print(f"Error after applying switch: {e}")
+
+        return {
+            "switch": switch,
+            "fronters": fronters_data,
+            "switched": True,
+            "coalesced": coalesced
+        }
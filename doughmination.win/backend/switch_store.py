@@ -0,0 +1,375 @@
+import asyncio
+import json
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+from dotenv import load_dotenv
+from pluralkit_client import pk_client, PRIORITY_BACKGROUND
+from snapshots import mark_stale, clear_stale
+from timestamps import switch_epoch_us
+
+load_dotenv()
+
+# Define data directory
+DATA_DIR = Path("dough-data")
+# Kept in a subdirectory, out of reach of /avatars/, which serves files in DATA_DIR by name
+PRIVATE_DIR = DATA_DIR / "private"
+SWITCHES_DB = PRIVATE_DIR / "switches.db"
+# Where the database used to be
+LEGACY_SWITCHES_DB = DATA_DIR / "switches.db"
+
+# Ensure data directory exists
+PRIVATE_DIR.mkdir(parents=True, exist_ok=True)
+
+# Move a database left in the old location, with its WAL files
+if LEGACY_SWITCHES_DB.exists() and not SWITCHES_DB.exists():
+    for suffix in ("", "-wal", "-shm"):
+        legacy = Path(f"{LEGACY_SWITCHES_DB}{suffix}")
+        if legacy.exists():
+            os.replace(legacy, f"{SWITCHES_DB}{suffix}")
+
+# PluralKit returns at most 100 switches per page
+PAGE_SIZE = 100
+
+# Stale-as-of time for a store that has never synced or held anything
+EPOCH_ISO = "1970-01-01T00:00:00+00:00"
+
+# Seconds between background syncs of new switches
+SWITCH_SYNC_INTERVAL = int(os.getenv("SWITCH_SYNC_INTERVAL", 60))
+
+# Incremented whenever stored switches change, so derived data knows when to rebuild
+_version = 0
+# Incremented when a change was more than new switches after the newest one
+# (edits, deletions, older switches), so incremental rollups start over
+_rewrites = 0
+_last_sync = 0.0  # monotonic time of the last successful sync
+_sync_lock = asyncio.Lock()
+
+
+@contextmanager
+def _db():
+    """Open a connection for one transaction; cheap enough to do per call"""
+    conn = sqlite3.connect(SWITCHES_DB)
+    conn.row_factory = sqlite3.Row
+    try:
+        with conn:
+            yield conn
+    finally:
+        conn.close()
+
+
+def _init_db():
+    with _db() as conn:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS switches (
+                id TEXT PRIMARY KEY,
+                ts INTEGER NOT NULL,
+                timestamp TEXT NOT NULL,
+                members TEXT NOT NULL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS switches_ts ON switches (ts)")
+        conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+
+
+_init_db()
+
+
+def _row_to_switch(row: sqlite3.Row) -> Dict[str, Any]:
+    return {
+        "id": row["id"],
+        "timestamp": row["timestamp"],
+        "members": json.loads(row["members"])
+    }
+
+
+def _get_meta(key: str) -> Optional[str]:
+    with _db() as conn:
+        row = conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+    return row["value"] if row else None
+
+
+def _set_meta(key: str, value: str):
+    with _db() as conn:
+        conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+
+def get_version() -> int:
+    """Changes whenever stored switches change"""
+    return _version
+
+
+def get_rewrites() -> int:
+    """Changes whenever stored history changed other than by appending newer switches"""
+    return _rewrites
+
+
+def add_switches(switches: Iterable[Dict[str, Any]]) -> int:
+    """
+    Store switches from PluralKit, updating stored ones whose timestamp or
+    members were edited. Returns the number added or changed.
+    """
+    global _version, _rewrites
+    rows = [
+        (switch["id"], switch_epoch_us(switch), switch["timestamp"], json.dumps(switch.get("members", [])))
+        for switch in switches
+    ]
+    if not rows:
+        return 0
+
+    known = _known_ids([row[0] for row in rows])
+    with _db() as conn:
+        newest = conn.execute("SELECT MAX(ts) AS ts FROM switches").fetchone()["ts"]
+        before = conn.total_changes
+        conn.executemany(
+            """
+            INSERT INTO switches (id, ts, timestamp, members) VALUES (?, ?, ?, ?)
+            ON CONFLICT(id) DO UPDATE SET ts = excluded.ts, timestamp = excluded.timestamp, members = excluded.members
+            WHERE switches.timestamp != excluded.timestamp OR switches.members != excluded.members
+            """,
+            rows
+        )
+        changed = conn.total_changes - before
+
+    if changed:
+        _version += 1
+        added = [row for row in rows if row[0] not in known]
+        if len(added) < changed or (newest is not None and any(row[1] <= newest for row in added)):
+            _rewrites += 1
+    return changed
+
+
+def delete_missing_switches(keep_ids: Iterable[str], after_us: Optional[int] = None) -> int:
+    """
+    Delete stored switches not in keep_ids, only those after after_us if
+    given. Used for the window a sync re-fetched. Returns the number deleted.
+    """
+    global _version, _rewrites
+    keep_ids = set(keep_ids)
+    with _db() as conn:
+        if after_us is None:
+            rows = conn.execute("SELECT id FROM switches").fetchall()
+        else:
+            rows = conn.execute("SELECT id FROM switches WHERE ts > ?", (after_us,)).fetchall()
+        deleted = [(row["id"],) for row in rows if row["id"] not in keep_ids]
+        if deleted:
+            conn.executemany("DELETE FROM switches WHERE id = ?", deleted)
+
+    if deleted:
+        _version += 1
+        _rewrites += 1
+    return len(deleted)
+
+
+def get_switches_since(since_us: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Get stored switches newest first, optionally only those at or after since_us"""
+    with _db() as conn:
+        if since_us is None:
+            rows = conn.execute("SELECT * FROM switches ORDER BY ts DESC").fetchall()
+        else:
+            rows = conn.execute(
+                "SELECT * FROM switches WHERE ts >= ? ORDER BY ts DESC",
+                (since_us,)
+            ).fetchall()
+    return [_row_to_switch(row) for row in rows]
+
+
+def iter_timeline_rows() -> List[tuple]:
+    """All stored switches oldest first as (id, epoch microseconds, member IDs)"""
+    with _db() as conn:
+        rows = conn.execute("SELECT id, ts, members FROM switches ORDER BY ts ASC").fetchall()
+    return [(row["id"], row["ts"], json.loads(row["members"])) for row in rows]
+
+
+def get_switch_position(switch_id: str) -> Optional[Tuple[int, str]]:
+    """(epoch microseconds, id) of a stored switch, the sort key used for paging"""
+    with _db() as conn:
+        row = conn.execute("SELECT ts, id FROM switches WHERE id = ?", (switch_id,)).fetchone()
+    return (row["ts"], row["id"]) if row else None
+
+
+def get_switch_page(before: Optional[Tuple[int, str]] = None, limit: int = 50) -> List[Dict[str, Any]]:
+    """Stored switches newest first, starting after the (ts, id) position `before`"""
+    with _db() as conn:
+        if before is None:
+            rows = conn.execute(
+                "SELECT * FROM switches ORDER BY ts DESC, id DESC LIMIT ?",
+                (limit,)
+            ).fetchall()
+        else:
+            rows = conn.execute(
+                "SELECT * FROM switches WHERE (ts, id) < (?, ?) ORDER BY ts DESC, id DESC LIMIT ?",
+                (*before, limit)
+            ).fetchall()
+    return [_row_to_switch(row) for row in rows]
+
+
+def iter_switches(batch_size: int = 1000) -> Iterator[Dict[str, Any]]:
+    """
+    Yield every stored switch oldest first, fetching batch_size rows per
+    query so the full history is never held in memory at once.
+    """
+    position = None
+    while True:
+        with _db() as conn:
+            if position is None:
+                rows = conn.execute(
+                    "SELECT * FROM switches ORDER BY ts, id LIMIT ?",
+                    (batch_size,)
+                ).fetchall()
+            else:
+                rows = conn.execute(
+                    "SELECT * FROM switches WHERE (ts, id) > (?, ?) ORDER BY ts, id LIMIT ?",
+                    (*position, batch_size)
+                ).fetchall()
+        for row in rows:
+            yield _row_to_switch(row)
+        if len(rows) < batch_size:
+            return
+        position = (rows[-1]["ts"], rows[-1]["id"])
+
+
+def _known_ids(ids: List[str]) -> set:
+    if not ids:
+        return set()
+    with _db() as conn:
+        placeholders = ",".join("?" * len(ids))
+        rows = conn.execute(f"SELECT id FROM switches WHERE id IN ({placeholders})", ids).fetchall()
+    return {row["id"] for row in rows}
+
+
+def _oldest_timestamp() -> Optional[str]:
+    with _db() as conn:
+        row = conn.execute("SELECT timestamp FROM switches ORDER BY ts ASC LIMIT 1").fetchone()
+    return row["timestamp"] if row else None
+
+
+def _count() -> int:
+    with _db() as conn:
+        return conn.execute("SELECT COUNT(*) AS n FROM switches").fetchone()["n"]
+
+
+def is_backfilled() -> bool:
+    return _get_meta("backfill_complete") == "1"
+
+
+async def _fetch_page(before: Optional[str] = None) -> List[Dict[str, Any]]:
+    params = {"limit": PAGE_SIZE}
+    if before:
+        params["before"] = before
+    return await pk_client.get("/systems/@me/switches", params=params, priority=PRIORITY_BACKGROUND) or []
+
+
+def _last_synced_at() -> str:
+    """When the store was last known to match PluralKit, for stale flags"""
+    synced_at = _get_meta("last_sync_at")
+    if synced_at:
+        return synced_at
+    with _db() as conn:
+        row = conn.execute("SELECT timestamp FROM switches ORDER BY ts DESC LIMIT 1").fetchone()
+    return row["timestamp"] if row else EPOCH_ISO
+
+
+async def sync_recent() -> int:
+    """
+    Re-fetch the newest switches, paging back until a known switch is found,
+    and make the store match PluralKit over that window: new switches are
+    added, edited ones updated and ones deleted upstream removed. With an
+    empty store only the newest page is fetched and the rest is left to
+    backfill(). Returns the number of switches added, changed or deleted.
+
+    While this fails, switch history is flagged stale under the "switches" key.
+    """
+    global _last_sync
+    async with _sync_lock:
+        try:
+            empty = _count() == 0
+            fetched = []
+            before = None
+            complete = False
+
+            while True:
+                page = await _fetch_page(before)
+                fetched.extend(page)
+                if len(page) < PAGE_SIZE:
+                    # That's the whole history
+                    complete = True
+                    break
+                if empty or _known_ids([switch["id"] for switch in page]):
+                    break
+                before = page[-1]["timestamp"]
+        except Exception:
+            mark_stale("switches", _last_synced_at())
+            raise
+
+        changed = add_switches(fetched)
+        if fetched:
+            # Before the oldest fetched switch, PluralKit's page may have cut off others at the same time
+            window_start = None if complete else min(switch_epoch_us(switch) for switch in fetched)
+            changed += delete_missing_switches((switch["id"] for switch in fetched), window_start)
+
+        _last_sync = time.monotonic()
+        _set_meta("last_sync_at", datetime.now(timezone.utc).isoformat())
+        clear_stale("switches")
+        if changed:
+            print(f"Stored {changed} new, edited or deleted switches")
+        return changed
+
+
+async def backfill():
+    """Page back through the full switch history once, oldest stored switch first"""
+    if is_backfilled():
+        return
+
+    print("Backfilling switch history from PluralKit")
+    while True:
+        page = await _fetch_page(_oldest_timestamp())
+        added = add_switches(page)
+        # A full page of switches we already had means we're not getting any further
+        if len(page) < PAGE_SIZE or not added:
+            break
+
+    _set_meta("backfill_complete", "1")
+    print(f"Switch history backfill complete, {_count()} switches stored")
+
+
+async def ensure_recent(max_age: float):
+    """
+    Sync new switches if the last sync is older than max_age seconds. If the
+    sync fails the stored history is still used, flagged stale (see
+    snapshots.stale_since("switches")).
+    """
+    if time.monotonic() - _last_sync < max_age:
+        return
+    try:
+        await sync_recent()
+    except Exception as e:
+        # Metrics can still be served from what we already have
+        print(f"Error syncing switches, using stored history: {e}")
+
+
+async def run_sync_loop():
+    """Background task: backfill once, then keep the store up to date"""
+    while True:
+        try:
+            await sync_recent()
+            await backfill()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Error syncing switch history: {e}")
+        await asyncio.sleep(SWITCH_SYNC_INTERVAL)
+
+
+def get_stats() -> Dict[str, Any]:
+    return {
+        "switches_stored": _count(),
+        "backfill_complete": is_backfilled(),
+        "version": _version,
+        "seconds_since_sync": round(time.monotonic() - _last_sync, 1) if _last_sync else None
+    }
@@ -0,0 +1,87 @@
+import asyncio
+import json
+import os
+import sys
+import tempfile
+from pathlib import Path
+from types import SimpleNamespace
+
+import httpx
+import pytest
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+
+# Modules create dough-data/ relative to the working directory on import, keep it out of the tree
+os.chdir(tempfile.mkdtemp(prefix="dough-tests-"))
+
+import cache  # noqa: E402
+import main  # noqa: E402
+import pluralkit_client  # noqa: E402
+import views  # noqa: E402
+from timestamps import pk_timestamp_to_epoch_us, switch_epoch_us  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+
+MEMBERS = [
+    {"id": "a", "name": "Clove"},
+    {"id": "b", "name": "Athena"},
+]
+
+
+class FakePluralKit:
+    """Answers PluralKit API requests and records (method, path) of each one"""
+    def __init__(self):
+        self.calls = []
+        self.delays = {}  # path suffix -> seconds to wait before answering
+        self.switches = []  # Switch history, newest first, paged like PluralKit does
+
+    async def handler(self, request: httpx.Request) -> httpx.Response:
+        path = request.url.path
+        self.calls.append((request.method, path))
+        for suffix, delay in self.delays.items():
+            if path.endswith(suffix):
+                await asyncio.sleep(delay)
+        if path.endswith("/members"):
+            return httpx.Response(200, json=MEMBERS)
+        if path.endswith("/fronters"):
+            return httpx.Response(200, json={"id": "s", "timestamp": "2024-01-01T00:00:00Z", "members": MEMBERS[:1]})
+        if path.endswith("/switches"):
+            if request.method == "POST":
+                member_ids = json.loads(request.content)["members"]
+                return httpx.Response(200, json={"id": "sw", "timestamp": "2024-01-02T00:00:00Z", "members": member_ids})
+            return httpx.Response(200, json=self.switch_page(request.url.params))
+        return httpx.Response(200, json={"id": "sys", "name": "Doughmination System"})
+
+    def switch_page(self, params) -> list:
+        """Up to limit switches strictly before the before= timestamp, newest first"""
+        switches = self.switches
+        if "before" in params:
+            before = pk_timestamp_to_epoch_us(params["before"])
+            switches = [switch for switch in switches if switch_epoch_us(switch) < before]
+        return switches[:int(params.get("limit", 100))]
+
+    def count(self, suffix: str) -> int:
+        return sum(1 for _, path in self.calls if path.endswith(suffix))
+
+
+@pytest.fixture
+def pluralkit(monkeypatch):
+    fake = FakePluralKit()
+    monkeypatch.setattr(pluralkit_client, "BACKOFF_BASE", 0.001)
+    monkeypatch.setattr(
+        pluralkit_client.pk_client, "_get_client",
+        lambda: httpx.AsyncClient(base_url=pluralkit_client.BASE_URL, transport=httpx.MockTransport(fake.handler))
+    )
+    # Start every test with cold caches
+    cache.clear_cache()
+    views._views.clear()
+    return fake
+
+
+@pytest.fixture
+def client(pluralkit):
+    admin = SimpleNamespace(id="admin", username="admin", is_admin=True)
+    main.app.dependency_overrides[main.get_current_user] = lambda: admin
+    with TestClient(main.app) as test_client:
+        yield test_client
+    main.app.dependency_overrides.clear()
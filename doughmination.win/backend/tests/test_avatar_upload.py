@@ -0,0 +1,91 @@
+import asyncio
+
+import avatars
+import main
+from users import get_users
+
+BOUNDARY = "avatar-test-boundary"
+PNG_HEADER = b"\x89PNG\r\n\x1a\n"
+
+
+def chunked_upload(filename: str, content: bytes, sent: list, chunk_size: int = 64 * 1024):
+    """A multipart body as a generator, so it goes out chunked without a Content-Length"""
+    head = (
+        f"--{BOUNDARY}\r\n"
+        f'Content-Disposition: form-data; name="avatar"; filename="{filename}"\r\n'
+        "Content-Type: application/octet-stream\r\n\r\n"
+    ).encode()
+    body = head + content + f"\r\n--{BOUNDARY}--\r\n".encode()
+    for start in range(0, len(body), chunk_size):
+        chunk = body[start:start + chunk_size]
+        sent.append(len(chunk))
+        yield chunk
+
+
+def post_avatar(client, user_id: str, body):
+    return client.post(
+        f"/api/users/{user_id}/avatar",
+        content=body,
+        headers={"Content-Type": f"multipart/form-data; boundary={BOUNDARY}"}
+    )
+
+
+def test_chunked_upload_over_limit_is_cut_off(client):
+    user_id = get_users()[0].id
+    sent = []
+    content = PNG_HEADER + b"\0" * (avatars.MAX_AVATAR_SIZE * 2)
+    chunks = chunked_upload("big.png", content, sent)
+    messages = []
+
+    # Called as raw ASGI, since the test client reads the whole body before the app sees it
+    async def receive():
+        chunk = next(chunks, None)
+        if chunk is None:
+            return {"type": "http.request", "body": b"", "more_body": False}
+        return {"type": "http.request", "body": chunk, "more_body": True}
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+        "method": "POST", "scheme": "http", "path": f"/api/users/{user_id}/avatar",
+        "raw_path": f"/api/users/{user_id}/avatar".encode(), "query_string": b"",
+        "root_path": "", "client": ("testclient", 50000), "server": ("testserver", 80),
+        "headers": [
+            (b"host", b"testserver"),
+            (b"content-type", f"multipart/form-data; boundary={BOUNDARY}".encode()),
+            (b"transfer-encoding", b"chunked"),
+        ],
+    }
+    asyncio.run(main.app(scope, receive, send))
+
+    assert messages[0]["type"] == "http.response.start"
+    assert messages[0]["status"] == 413
+    # Reading stopped just past the limit, not at the end of the body
+    assert avatars.MAX_AVATAR_SIZE < sum(sent) <= avatars.MAX_AVATAR_SIZE + 64 * 1024
+    assert not list(avatars.DATA_DIR.glob(f"{user_id}_*"))
+
+
+def test_chunked_upload_under_limit_is_saved(client):
+    user_id = get_users()[0].id
+    content = PNG_HEADER + b"\0" * 1024
+
+    response = post_avatar(client, user_id, chunked_upload("small.png", content, []))
+
+    assert response.status_code == 200
+    saved = list(avatars.DATA_DIR.glob(f"{user_id}_*.png"))
+    assert len(saved) == 1
+    assert saved[0].read_bytes() == content
+
+
+def test_only_avatar_files_are_served(client):
+    user_id = get_users()[0].id
+    post_avatar(client, user_id, chunked_upload("served.png", PNG_HEADER + b"\0" * 16, []))
+    filename = get_users()[0].avatar_url.split("/")[-1]
+
+    assert client.get(f"/avatars/{filename}").status_code == 200
+    # Other data lives next to the avatars, but isn't public
+    assert (avatars.DATA_DIR / "users.json").exists()
+    for name in ("users.json", "switches.db", "dynamic_cofronts.json", f"{filename}.tmp"):
+        assert client.get(f"/avatars/{name}").status_code == 404
@@ -0,0 +1,23 @@
+def test_cold_bootstrap_fetches_each_resource_once(client, pluralkit):
+    # Members arrive last, after get_fronters already wants them
+    pluralkit.delays["/members"] = 0.2
+    response = client.get("/api/bootstrap")
+
+    assert response.status_code == 200
+    data = response.json()
+    assert [member["id"] for member in data["members"]] == ["a", "b"]
+    assert data["fronters"]["members"][0]["id"] == "a"
+    # get_fronters needs the members too, but shares the in-flight fetch
+    assert pluralkit.count("/systems/@me") == 1
+    assert pluralkit.count("/fronters") == 1
+    assert pluralkit.count("/members") == 1
+
+
+def test_bootstrap_leaves_out_known_parts(client, pluralkit):
+    versions = client.get("/api/bootstrap").json()["versions"]
+
+    data = client.get(f"/api/bootstrap?known=members:{versions['members']}").json()
+
+    assert data["unchanged"] == ["members"]
+    assert "members" not in data
+    assert "fronters" in data
@@ -0,0 +1,10 @@
+import mental_state
+
+
+def test_mental_state_log_is_not_served(client):
+    assert client.post("/api/mental-state", json={"level": "safe", "notes": "private"}).status_code == 200
+
+    assert mental_state.MENTAL_STATE_LOG.exists()
+    assert not (mental_state.DATA_DIR / "mental_state_log.jsonl").exists()
+    assert client.get("/avatars/mental_state_log.jsonl").status_code == 404
+    assert client.get("/api/mental-state/history").json()["entries"][-1]["notes"] == "private"
@@ -0,0 +1,74 @@
+from rollups import FrontingRollups, US_PER_DAY, US_PER_HOUR
+from timeline import SwitchTimeline
+
+US_PER_MINUTE = 60 * 1_000_000
+DAY = 20_000 * US_PER_DAY  # Midnight UTC
+
+# (id, epoch microseconds, fronting member IDs)
+SWITCHES = [
+    ("s1", DAY - 5 * US_PER_HOUR - 7 * US_PER_MINUTE, ["a"]),
+    # Crosses midnight into the next day
+    ("s2", DAY - 90 * US_PER_MINUTE, ["a", "b"]),
+    ("s3", DAY + 2 * US_PER_HOUR + 13 * US_PER_MINUTE, []),
+    ("s4", DAY + 2 * US_PER_HOUR + 40 * US_PER_MINUTE, ["c"]),
+    ("s5", DAY + 3 * US_PER_DAY + 11 * US_PER_MINUTE, ["b"]),
+]
+NOW = DAY + 3 * US_PER_DAY + 5 * US_PER_HOUR + 1
+
+
+def brute_force(switches, start, end, now):
+    """Fronting microseconds per member in [start, end), one interval at a time"""
+    totals = {}
+    for i, (_, ts, member_ids) in enumerate(switches):
+        interval_end = switches[i + 1][1] if i + 1 < len(switches) else now
+        overlap = min(interval_end, end, now) - max(ts, start)
+        if overlap > 0:
+            for member_id in member_ids:
+                totals[member_id] = totals.get(member_id, 0) + overlap
+    return totals
+
+
+def windows():
+    first = SWITCHES[0][1]
+    edges = [first - US_PER_DAY, first, DAY - US_PER_HOUR - 1, DAY, DAY + 17 * US_PER_MINUTE,
+             DAY + US_PER_DAY + 3, DAY + 2 * US_PER_DAY, NOW - 1, NOW, NOW + US_PER_DAY]
+    return [(start, end) for start in edges for end in edges if start < end]
+
+
+def check(rollups, switches):
+    for start, end in windows():
+        _, totals = rollups.fronting_us(start, end, NOW)
+        assert totals == brute_force(switches, start, end, NOW), (start, end)
+
+
+def test_rollups_match_brute_force():
+    rollups = FrontingRollups()
+    rollups.update(SwitchTimeline(1, SWITCHES))
+
+    check(rollups, SWITCHES)
+    total_us, _ = rollups.fronting_us(DAY, DAY + US_PER_DAY, NOW)
+    assert total_us == US_PER_DAY
+
+
+def test_incremental_update_matches_rebuild():
+    rollups = FrontingRollups()
+    rollups.update(SwitchTimeline(1, SWITCHES[:2]))
+    rollups.update(SwitchTimeline(2, SWITCHES[:4]))
+    rollups.update(SwitchTimeline(3, SWITCHES))
+
+    check(rollups, SWITCHES)
+
+
+def test_rewritten_history_is_rolled_up_again():
+    rollups = FrontingRollups()
+    rollups.update(SwitchTimeline(1, SWITCHES))
+
+    # s2 edited upstream: same switches, so only rewrites tells the rollups to start over
+    edited = [(switch_id, ts, ["b"] if switch_id == "s2" else member_ids) for switch_id, ts, member_ids in SWITCHES]
+    rollups.update(SwitchTimeline(2, edited, rewrites=1))
+    check(rollups, edited)
+
+    # s3 deleted upstream
+    deleted = [switch for switch in edited if switch[0] != "s3"]
+    rollups.update(SwitchTimeline(3, deleted, rewrites=2))
+    check(rollups, deleted)
@@ -0,0 +1,30 @@
+import asyncio
+
+import pluralkit
+import snapshots
+from pluralkit_client import PluralKitError
+
+
+def test_unchanged_data_moves_confirmed_at_forward(monkeypatch):
+    snapshots.save_snapshot("test_system", {"name": "x"})
+    snapshot = snapshots.load_snapshot("test_system")
+    # Pretend the data was first saved long ago
+    snapshot["saved_at"] = snapshot["confirmed_at"] = "2020-01-01T00:00:00+00:00"
+
+    snapshots.save_snapshot("test_system", {"name": "x"})
+
+    assert snapshot["saved_at"] == "2020-01-01T00:00:00+00:00"
+    assert snapshot["confirmed_at"] > "2020-01-01T00:00:00+00:00"
+    # The confirmation survives a restart
+    snapshots._snapshots.clear()
+    assert snapshots.load_snapshot("test_system")["confirmed_at"] == snapshot["confirmed_at"]
+
+    async def failing_get(path, priority=None):
+        raise PluralKitError("PluralKit is down", status_code=503)
+
+    monkeypatch.setattr(pluralkit.pk_client, "get", failing_get)
+    data, stale = asyncio.run(pluralkit.fetch_with_snapshot("test_system", "/systems/@me"))
+
+    assert stale and data == {"name": "x"}
+    assert snapshots.stale_since("test_system") == snapshot["confirmed_at"]
+    snapshots.clear_stale("test_system")
@@ -0,0 +1,15 @@
+import cache
+
+
+def test_switch_does_not_refetch_members(client, pluralkit):
+    assert client.get("/api/members").status_code == 200
+    # Every cached entry expired, but the last member index is still known
+    cache.clear_cache()
+    pluralkit.calls.clear()
+
+    response = client.post("/api/switch", json={"members": ["b"]})
+
+    assert response.status_code == 200
+    assert response.json()["fronters"]["members"][0]["name"] == "Athena"
+    assert pluralkit.count("/members") == 0
+    assert ("POST", "/v2/systems/@me/switches") in pluralkit.calls
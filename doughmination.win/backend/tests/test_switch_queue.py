@@ -0,0 +1,36 @@
+import asyncio
+
+import cache
+import switch_queue
+from switch_queue import SwitchQueue
+
+
+def test_reordering_fronters_is_a_switch(monkeypatch):
+    written = []
+
+    async def fake_set_front(member_ids):
+        written.append(list(member_ids))
+        return {"id": f"sw{len(written)}", "members": member_ids}
+
+    async def fake_apply_switch(member_ids, switch):
+        fronters = {"members": [{"id": member_id} for member_id in member_ids]}
+        cache.set_in_cache("fronters", fronters)
+        return fronters
+
+    monkeypatch.setattr(switch_queue, "set_front", fake_set_front)
+    monkeypatch.setattr(switch_queue, "apply_switch", fake_apply_switch)
+    cache.set_in_cache("fronters", {"members": [{"id": "a"}, {"id": "b"}]})
+    queue = SwitchQueue(window=0)
+
+    async def run():
+        same = await queue.submit(["a", "b"])
+        # Same members, but b becomes the primary fronter
+        swapped = await queue.submit(["b", "a"])
+        return same, swapped
+
+    same, swapped = asyncio.run(run())
+    cache.clear_cache()
+
+    assert not same["switched"]
+    assert swapped["switched"]
+    assert written == [["b", "a"]]
@@ -0,0 +1,122 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import snapshots
+import switch_store
+
+START = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def make_switches(count: int, members=("a",)) -> list:
+    """count switches a minute apart, newest first like PluralKit returns them"""
+    return [
+        {
+            "id": f"s{i:04d}",
+            "timestamp": (START + timedelta(minutes=i)).strftime("%Y-%m-%dT%H:%M:%S.%fZ"),
+            "members": list(members)
+        }
+        for i in reversed(range(count))
+    ]
+
+
+def stored_ids() -> list:
+    return sorted(row[0] for row in switch_store.iter_timeline_rows())
+
+
+def ids(switches: list) -> list:
+    return sorted(switch["id"] for switch in switches)
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch, pluralkit):
+    """An empty switch store in its own database, synced from the fake PluralKit"""
+    monkeypatch.setattr(switch_store, "SWITCHES_DB", tmp_path / "switches.db")
+    switch_store._init_db()
+    return pluralkit
+
+
+def test_backfill_pages_through_the_whole_history(store):
+    store.switches = make_switches(250)
+
+    async def run():
+        await switch_store.sync_recent()
+        # An empty store only gets the newest page from a sync
+        synced = switch_store._count()
+        await switch_store.backfill()
+        return synced
+
+    assert asyncio.run(run()) == switch_store.PAGE_SIZE
+    assert stored_ids() == ids(store.switches)
+    assert switch_store.is_backfilled()
+    # Newest page, then the two older ones
+    assert store.count("/switches") == 3
+
+
+def test_add_switches_upserts_and_tracks_rewrites(store):
+    switches = make_switches(3)
+    assert switch_store.add_switches(switches[1:]) == 2
+    rewrites = switch_store.get_rewrites()
+
+    # Unchanged switches are no change at all
+    assert switch_store.add_switches(switches[1:]) == 0
+    # A newer switch is an append
+    assert switch_store.add_switches(switches[:1]) == 1
+    assert switch_store.get_rewrites() == rewrites
+
+    # An edit is a rewrite
+    edited = {**switches[1], "members": ["b"]}
+    version = switch_store.get_version()
+    assert switch_store.add_switches([edited]) == 1
+    assert switch_store.get_version() == version + 1
+    assert switch_store.get_rewrites() == rewrites + 1
+    assert dict((row[0], row[2]) for row in switch_store.iter_timeline_rows())[edited["id"]] == ["b"]
+
+
+def test_sync_applies_upstream_edits_and_deletions(store):
+    store.switches = make_switches(5)
+    asyncio.run(switch_store.sync_recent())
+    rewrites = switch_store.get_rewrites()
+
+    # Upstream: one new switch, one edited, one deleted
+    newest = make_switches(6)[0]
+    edited = {**store.switches[2], "members": ["a", "b"]}
+    store.switches = [newest, store.switches[0], store.switches[1], edited, store.switches[4]]
+
+    assert asyncio.run(switch_store.sync_recent()) == 3
+    assert stored_ids() == ids(store.switches)
+    assert dict((row[0], row[2]) for row in switch_store.iter_timeline_rows())[edited["id"]] == ["a", "b"]
+    assert switch_store.get_rewrites() > rewrites
+
+
+def test_sync_only_deletes_within_the_refetched_window(store):
+    store.switches = make_switches(150)
+
+    async def fill():
+        await switch_store.sync_recent()
+        await switch_store.backfill()
+
+    asyncio.run(fill())
+    assert switch_store._count() == 150
+
+    # Deleted upstream: one in the newest page, one older than anything a sync re-fetches
+    recent, old = store.switches[10], store.switches[140]
+    store.switches = [switch for switch in store.switches if switch not in (recent, old)]
+
+    assert asyncio.run(switch_store.sync_recent()) == 1
+    remaining = set(stored_ids())
+    assert recent["id"] not in remaining
+    assert old["id"] in remaining
+
+
+def test_failed_sync_flags_history_stale(store, monkeypatch):
+    async def failing_fetch(before=None):
+        raise RuntimeError("PluralKit is down")
+
+    monkeypatch.setattr(switch_store, "_fetch_page", failing_fetch)
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(switch_store.sync_recent())
+    assert snapshots.stale_since("switches") is not None
+    snapshots.clear_stale("switches")
@@ -0,0 +1,53 @@
+import asyncio
+import uuid
+
+import avatars
+
+
+def avatar_name(ext: str = ".png") -> str:
+    return f"{uuid.uuid4()}_{uuid.uuid4()}{ext}"
+
+
+def test_only_avatars_missing_thumbnails_are_scheduled(monkeypatch):
+    made = []
+
+    async def fake_generate(filename):
+        made.append(filename)
+
+    monkeypatch.setattr(avatars, "generate_thumbnails", fake_generate)
+    missing, complete = avatar_name(), avatar_name(".gif")
+    for filename in (missing, complete):
+        (avatars.DATA_DIR / filename).write_bytes(b"")
+    for size in avatars.THUMBNAIL_SIZES:
+        for fmt in avatars.THUMBNAIL_FORMATS:
+            (avatars.DATA_DIR / avatars.thumbnail_filename(complete, size, fmt)).write_bytes(b"")
+
+    async def run():
+        avatars.backfill_thumbnails()
+        # Other data files and thumbnails never get any
+        avatars.schedule_thumbnails("users.json")
+        avatars.schedule_thumbnails(avatars.thumbnail_filename(complete, 64, "png"))
+        await asyncio.sleep(0)
+
+    asyncio.run(run())
+
+    assert missing in made
+    assert complete not in made
+    assert "users.json" not in made
+    assert all(avatars.is_avatar(filename) for filename in made)
+
+
+def test_thumbnail_requests_do_not_schedule_work(client, monkeypatch):
+    made = []
+
+    async def fake_generate(filename):
+        made.append(filename)
+
+    monkeypatch.setattr(avatars, "generate_thumbnails", fake_generate)
+    filename = avatar_name()
+    (avatars.DATA_DIR / filename).write_bytes(b"\x89PNG\r\n\x1a\n")
+
+    for _ in range(3):
+        assert client.get(f"/avatars/{filename}?size=64").status_code == 200
+    assert client.get("/avatars/users.json?size=64").status_code == 404
+    assert made == []
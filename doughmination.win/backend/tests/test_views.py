@@ -0,0 +1,35 @@
+import asyncio
+
+import views
+
+
+def test_compression_failures_are_logged(monkeypatch, capsys):
+    def failing_compress(self):
+        raise RuntimeError("compressor broke")
+
+    monkeypatch.setattr(views.CachedView, "compress", failing_compress)
+
+    async def run():
+        view = views.get_view("test-compress", (1,), lambda: {"text": "x" * 4096})
+        await asyncio.gather(*views._compress_tasks, return_exceptions=True)
+        await asyncio.sleep(0)
+        return view
+
+    view = asyncio.run(run())
+
+    assert "Error compressing view: compressor broke" in capsys.readouterr().out
+    assert not views._compress_tasks
+    assert view.negotiate("gzip")[1] is None
+
+
+def test_views_are_compressed_in_the_background():
+    async def run():
+        view = views.get_view("test-compressed", (1,), lambda: {"text": "x" * 4096})
+        await asyncio.gather(*views._compress_tasks)
+        return view
+
+    view = asyncio.run(run())
+
+    body, encoding, etag = view.negotiate("gzip")
+    assert encoding == "gzip"
+    assert len(body) < len(view.body)
@@ -0,0 +1,93 @@
+import os
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import Dict, List, Optional, Tuple
+from dotenv import load_dotenv
+from switch_store import ensure_recent, get_version, get_rewrites, iter_timeline_rows
+
+load_dotenv()
+
+CACHE_TTL = int(os.getenv("CACHE_TTL", 30))
+
+
+class SwitchTimeline:
+    """
+    The stored switch history, oldest first, as parallel arrays.
+
+    timestamps holds epoch microseconds (int64), so durations come out exactly
+    as timedelta.total_seconds() would give them. Member IDs are interned:
+    members[i] is a tuple of indexes into member_ids for switch i. rewrites
+    changes when the history changed other than by appending newer switches.
+    """
+    __slots__ = ("version", "rewrites", "switch_ids", "timestamps", "members", "member_ids", "member_index", "_groups")
+
+    def __init__(self, version: int, rows, rewrites: int = 0):
+        self.version = version
+        self.rewrites = rewrites
+        self.switch_ids: List[str] = []
+        self.timestamps = array("q")
+        self.members: List[Tuple[int, ...]] = []
+        self.member_ids: List[str] = []
+        self.member_index: Dict[str, int] = {}
+        self._groups: Optional[Tuple[List[int], List[Tuple[int, ...]]]] = None
+
+        for switch_id, ts, member_ids in rows:
+            self.switch_ids.append(switch_id)
+            self.timestamps.append(ts)
+            self.members.append(tuple(self.intern(member_id) for member_id in member_ids))
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+    def intern(self, member_id: str) -> int:
+        index = self.member_index.get(member_id)
+        if index is None:
+            index = len(self.member_ids)
+            self.member_ids.append(member_id)
+            self.member_index[member_id] = index
+        return index
+
+    def index_at_or_after(self, ts: int) -> int:
+        """Index of the first switch at or after ts (epoch microseconds)"""
+        return bisect_left(self.timestamps, ts)
+
+    def index_after(self, ts: int) -> int:
+        """Index of the first switch strictly after ts (epoch microseconds)"""
+        return bisect_right(self.timestamps, ts)
+
+    def member_id_list(self, i: int) -> List[str]:
+        """Member IDs fronting from switch i"""
+        return [self.member_ids[m] for m in self.members[i]]
+
+    def groups(self) -> Tuple[List[int], List[Tuple[int, ...]]]:
+        """
+        Distinct fronting groups, interned on first use.
+        Returns (group index for each switch, sorted member indexes of each group).
+        """
+        if self._groups is None:
+            group_index: Dict[Tuple[int, ...], int] = {}
+            switch_groups = []
+            for members in self.members:
+                key = tuple(sorted(set(members)))
+                switch_groups.append(group_index.setdefault(key, len(group_index)))
+            self._groups = (switch_groups, list(group_index))
+        return self._groups
+
+
+_timeline: Optional[SwitchTimeline] = None
+
+
+async def get_timeline(sync: bool = True) -> SwitchTimeline:
+    """
+    Get the shared timeline, rebuilding it only when new switches were stored.
+    With sync=False only the local store is read, leaving freshness to the
+    background sync loop.
+    """
+    global _timeline
+    if sync:
+        await ensure_recent(CACHE_TTL)
+
+    version = get_version()
+    if _timeline is None or _timeline.version != version:
+        _timeline = SwitchTimeline(version, iter_timeline_rows(), get_rewrites())
+    return _timeline
@@ -0,0 +1,81 @@
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict
+import re
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+def parse_timestamp(timestamp_str: str) -> datetime:
+    """Parse timestamp string into datetime with proper timezone handling"""
+    try:
+        # Handle Z timezone
+        if timestamp_str.endswith('Z'):
+            timestamp_str = timestamp_str[:-1] + '+00:00'
+        
+        # Try direct parsing first
+        try:
+            dt = datetime.fromisoformat(timestamp_str)
+        except ValueError:
+            # If direct parsing fails, try handling microsecond precision issues
+            match = re.match(r'(\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}\.\d+)(\+\d{2}:\d{2})', timestamp_str)
+            if match:
+                # Truncate microseconds to 6 digits and rebuild the string
+                base = match.group(1)
+                if len(base.split('.')[-1]) > 6:
+                    base = base.split('.')[0] + '.' + base.split('.')[-1][:6]
+                timestamp_str = f"{base}{match.group(2)}"
+                dt = datetime.fromisoformat(timestamp_str)
+            else:
+                # Try another approach for microsecond issues
+                parts = timestamp_str.split('.')
+                if len(parts) == 2 and '+' in parts[1]:
+                    ms_part, tz_part = parts[1].split('+', 1)
+                    if len(ms_part) > 6:
+                        ms_part = ms_part[:6]
+                    timestamp_str = f"{parts[0]}.{ms_part}+{tz_part}"
+                    dt = datetime.fromisoformat(timestamp_str)
+                else:
+                    raise ValueError(f"Could not parse timestamp: {timestamp_str}")
+        
+        # Ensure it's timezone-aware
+        if dt.tzinfo is None:
+            dt = dt.replace(tzinfo=timezone.utc)
+        
+        return dt
+    except Exception as e:
+        print(f"Error parsing timestamp {timestamp_str}: {str(e)}")
+        raise
+
+def datetime_to_epoch_us(dt: datetime) -> int:
+    """Convert an aware datetime into integer microseconds since the unix epoch"""
+    delta = dt - EPOCH
+    return (delta.days * 86400 + delta.seconds) * 1_000_000 + delta.microseconds
+
+def epoch_us_to_datetime(epoch_us: int) -> datetime:
+    """Convert integer microseconds since the unix epoch into an aware UTC datetime"""
+    return EPOCH + timedelta(microseconds=epoch_us)
+
+def to_epoch_us(timestamp_str: str) -> int:
+    """Parse a timestamp string into integer microseconds since the unix epoch"""
+    return datetime_to_epoch_us(parse_timestamp(timestamp_str))
+
+def pk_timestamp_to_epoch_us(timestamp_str: str) -> int:
+    """
+    Fast path for PluralKit's "YYYY-MM-DDTHH:MM:SS.ffffffZ" timestamps.
+    
+    fromisoformat accepts these directly on Python 3.11+ (Z suffix, more
+    than 6 fractional digits), so the string handling in parse_timestamp is
+    only needed as a fallback.
+    """
+    try:
+        dt = datetime.fromisoformat(timestamp_str)
+    except ValueError:
+        return to_epoch_us(timestamp_str)
+    if dt.tzinfo is None:
+        return to_epoch_us(timestamp_str)
+    
+    delta = dt - EPOCH
+    return (delta.days * 86400 + delta.seconds) * 1_000_000 + delta.microseconds
+
+def switch_epoch_us(switch: Dict[str, Any]) -> int:
+    """Epoch microseconds of a PluralKit switch"""
+    return pk_timestamp_to_epoch_us(switch["timestamp"])
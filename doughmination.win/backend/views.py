@@ -0,0 +1,180 @@
+import asyncio
+import gzip
+import hashlib
+import json
+from typing import Any, Callable, Dict, Optional, Tuple
+from fastapi import Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import Response
+
+try:
+    import brotli
+except ImportError:  # Optional; gzip is still offered without it
+    brotli = None
+
+# Clients may keep a copy but must revalidate it (If-None-Match) before use
+CACHE_CONTROL = "no-cache"
+VARY = "Accept-Encoding"
+
+# Bodies smaller than this aren't worth compressing
+MIN_COMPRESS_SIZE = 1024
+
+# Views kept at once; query parameters can make many, so drop the oldest past this
+MAX_VIEWS = 256
+
+
+def serialize(payload: Any) -> bytes:
+    """Encode a payload exactly as FastAPI's JSONResponse would"""
+    return json.dumps(
+        jsonable_encoder(payload),
+        ensure_ascii=False,
+        allow_nan=False,
+        indent=None,
+        separators=(",", ":")
+    ).encode("utf-8")
+
+
+class CachedView:
+    """
+    A response payload serialized once, with an ETag over its bytes and a
+    version that is bumped whenever the bytes change. Large bodies also get
+    gzip (and brotli, if installed) variants, compressed once by compress().
+    """
+    __slots__ = ("payload", "sources", "body", "etag", "version", "headers", "encoded")
+
+    def __init__(self, payload: Any, sources: tuple, version: int = 1, headers: Optional[Dict[str, str]] = None):
+        self.payload = payload
+        self.sources = sources
+        self.body = serialize(payload)
+        self.etag = f'"{hashlib.sha1(self.body).hexdigest()}"'
+        self.version = version
+        self.headers = headers or {}
+
+        # Content-Encoding -> compressed body, in order of preference; empty until compress() ran
+        self.encoded: Dict[str, bytes] = {}
+
+    def needs_compression(self) -> bool:
+        return len(self.body) >= MIN_COMPRESS_SIZE and not self.encoded
+
+    def compress(self):
+        """Make the compressed variants. Slow at these levels, so get_view runs it in a worker thread."""
+        encoded = {}
+        if brotli is not None:
+            encoded["br"] = brotli.compress(self.body, quality=9)
+        encoded["gzip"] = gzip.compress(self.body, compresslevel=9, mtime=0)
+        # Swapped in whole, so a request served meanwhile sees all variants or none
+        self.encoded = encoded
+
+    def negotiate(self, accept_encoding: Optional[str]) -> Tuple[bytes, Optional[str], str]:
+        """Pick the body for an Accept-Encoding header: (body, Content-Encoding, ETag)"""
+        accepted = parse_accept_encoding(accept_encoding)
+        for encoding, body in self.encoded.items():
+            if accepted.get(encoding, accepted.get("*", 0)) > 0:
+                # Each encoding is a different representation, so it gets its own ETag
+                return body, encoding, f'{self.etag[:-1]}-{encoding}"'
+        return self.body, None, self.etag
+
+
+_views: Dict[str, CachedView] = {}
+# Compressions running in worker threads
+_compress_tasks = set()
+
+
+def _same_sources(a: tuple, b: tuple) -> bool:
+    # Cached data is usually the very same object, which is cheap to check
+    return len(a) == len(b) and all(x is y or x == y for x, y in zip(a, b))
+
+
+def get_view(
+    key: str,
+    sources: tuple,
+    build: Callable[[], Any],
+    headers: Optional[Dict[str, str]] = None
+) -> CachedView:
+    """
+    Get the view for key, rebuilding it with build() only when its sources
+    (the cached data it is made from) changed since it was last built. New
+    views are compressed in the background. Must be called from the event loop.
+    """
+    headers = headers or {}
+    view = _views.get(key)
+    if view is not None and view.headers == headers and _same_sources(view.sources, sources):
+        return view
+
+    new_view = CachedView(build(), sources, headers=headers)
+    if view is not None:
+        new_view.version = view.version if new_view.etag == view.etag else view.version + 1
+        if new_view.etag == view.etag:
+            # Same bytes, so the old compressed variants still apply
+            new_view.encoded = view.encoded
+    elif len(_views) >= MAX_VIEWS:
+        _views.pop(next(iter(_views)))
+    _views[key] = new_view
+
+    if new_view.needs_compression():
+        # Requests until it's done get the uncompressed body rather than waiting on the event loop
+        future = asyncio.get_running_loop().run_in_executor(None, new_view.compress)
+        _compress_tasks.add(future)
+        future.add_done_callback(_compress_done)
+    return new_view
+
+
+def _compress_done(future: asyncio.Future):
+    _compress_tasks.discard(future)
+    if not future.cancelled() and (e := future.exception()) is not None:
+        # The view is still served, just uncompressed
+        print(f"Error compressing view: {e}")
+
+
+def parse_accept_encoding(header: Optional[str]) -> Dict[str, float]:
+    """Accept-Encoding as {coding: q}"""
+    accepted = {}
+    for part in (header or "").split(","):
+        coding, _, params = part.strip().partition(";")
+        if not coding:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[coding.strip().lower()] = q
+    return accepted
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """
+    Whether an If-None-Match header matches etag. Comparison is weak, and
+    the encoded variants of the same bytes count as a match.
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    for tag in if_none_match.split(","):
+        tag = tag.strip().removeprefix("W/")
+        for encoding in ('-gzip"', '-br"'):
+            if tag.endswith(encoding):
+                tag = tag[:-len(encoding)] + '"'
+        if tag == etag:
+            return True
+    return False
+
+
+def view_response(request: Request, view: CachedView) -> Response:
+    """Serve a view's bytes in the best accepted encoding, or an empty 304 if the client already has them"""
+    body, encoding, etag = view.negotiate(request.headers.get("accept-encoding"))
+    headers = {
+        "ETag": etag,
+        "Cache-Control": CACHE_CONTROL,
+        "Vary": VARY,
+        "X-View-Version": str(view.version),
+        **view.headers
+    }
+    if etag_matches(request.headers.get("if-none-match"), view.etag):
+        return Response(status_code=304, headers=headers)
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return Response(content=body, media_type="application/json", headers=headers)